@@ -0,0 +1,78 @@
+r"""
+Benchmarks slide-page extraction in scraper.py: the <head>-only fast path against 
+the full BeautifulSoup parse, over slide pages saved as .html files in a folder. 
+Every page is also checked to give the same caption and image URL both ways.
+
+Usage: 
+	$ python bench_extract.py <fixtures folder>
+	$ python bench_extract.py <fixtures folder> -save:<story_id> (First save that story's slide pages into the folder)
+	$ python bench_extract.py <fixtures folder> -rounds:20 (Parse every page 20 times, default 10)
+
+"""
+
+import os
+import sys
+import time
+import requests
+import scraper
+
+def save_fixtures(folder, story_id):
+    """Save the slide pages of one story, politely, as fixtures."""
+    os.makedirs(folder, exist_ok=True)
+    slide_number = 1
+    while True:
+        url = f"{scraper.NEWS_URL}/story/{story_id}/slideshow/{slide_number}/"
+        response = requests.get(url, timeout=60)
+        if response.status_code != 200:
+            break
+        filename = os.path.join(folder, f"{story_id}-{slide_number}.html")
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(response.text)
+        print(f"Saved {filename}")
+        slide_number += 1
+        time.sleep(scraper.PAGE_INTERVAL)
+
+def time_per_page(extract, pages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages.values():
+            extract(html)
+    return (time.perf_counter() - start) / (rounds * len(pages))
+
+def benchmark(folder, rounds=10):
+    pages = {}
+    for name in sorted(os.listdir(folder)):
+        if name.endswith(".html"):
+            with open(os.path.join(folder, name), "r", encoding="utf-8") as f:
+                pages[name] = f.read()
+    if not pages:
+        print(f"No .html fixtures in {folder}")
+        return
+
+    fast_path = 0
+    for name, html in pages.items():
+        if scraper.extract_slide_head(html) is not None:
+            fast_path += 1
+        if scraper.extract_slide(html) != scraper.extract_slide_full(html):
+            print(f"Mismatch in {name}: {scraper.extract_slide(html)} != {scraper.extract_slide_full(html)}")
+
+    full = time_per_page(scraper.extract_slide_full, pages, rounds)
+    fast = time_per_page(scraper.extract_slide, pages, rounds)
+    print(f"{len(pages)} pages, {fast_path} on the fast path")
+    print(f"Full parse: {full * 1000:.2f} ms/page")
+    print(f"Fast path:  {fast * 1000:.2f} ms/page ({full / fast:.1f}x)")
+
+if __name__ == "__main__":
+    options = [arg for arg in sys.argv[1:] if arg.startswith("-")]
+    positional = [arg for arg in sys.argv[1:] if arg not in options]
+    if len(positional) != 1:
+        print("Usage: python bench_extract.py <fixtures folder> [-save:<story_id>] [-rounds:N]")
+        sys.exit(1)
+
+    rounds = 10
+    for option in options:
+        if option.startswith("-save:"):
+            save_fixtures(positional[0], int(option.split(":", 1)[1]))
+        elif option.startswith("-rounds:"):
+            rounds = int(option.split(":", 1)[1])
+    benchmark(positional[0], rounds)
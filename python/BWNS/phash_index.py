@@ -0,0 +1,241 @@
+r"""
+Perceptual-hash index of BWNS images. BWNS reuses photos across stories at other sizes
+and crops, which the byte-level check in scraper.py can't see, so scraper.py also looks
+every new image up here and flags (or with -skip-similar, drops) those that look like an
+image already downloaded or already on bahai.media.
+
+Images are reduced to a 64-bit difference hash (dHash). Lookups use multi-index hashing:
+the hash is split into 4 bands of 16 bits, and any two hashes within 8 bits of each
+other agree within 2 bits on at least one band, so a lookup only compares the few
+images that share a nearby band value.
+
+The index is kept in phash-index.tsv, one "<hash>	<source>	<name>" line per image.
+Story images that scraper.py deletes (e.g. after a caption change) are dropped from it,
+as are those -output finds missing.
+
+Usage:
+	$ python phash_index.py -output (Index every image in output/ not indexed yet)
+	$ python phash_index.py -wiki (Index bahai.media files from their thumbnails)
+	$ python phash_index.py -wiki -api:http://localhost:8080/api.php -interval:0.5
+	$ python phash_index.py <image file> (List indexed images that look like this one)
+	$ python phash_index.py <image file> -distance:12 (Allow hashes up to 12 bits apart, default 8)
+
+Needs Pillow (pip install Pillow). Without it scraper.py runs without the check.
+"""
+
+import io
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+import requests
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+INDEX_FILE = "phash-index.tsv"
+OUTPUT_FOLDER = "output"
+MAX_DISTANCE = 8  # Bits out of 64; resized or recompressed copies are usually within 4
+BANDS = 4
+BAND_BITS = 16
+THUMB_WIDTH = 256
+WIKI_INTERVAL = 1.0  # Seconds between thumbnail downloads
+
+def dhash(source):
+    """Return the 64-bit difference hash of an image file (path or file object)."""
+    with Image.open(source) as img:
+        img.draft("L", (64, 64))  # JPEGs can be decoded straight to a small size
+        pixels = img.convert("L").resize((9, 8), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+@lru_cache(maxsize=None)
+def band_masks(radius):
+    """All BAND_BITS-bit masks with at most radius bits set."""
+    return [sum(1 << bit for bit in bits) for r in range(radius + 1)
+            for bits in itertools.combinations(range(BAND_BITS), r)]
+
+class PhashIndex:
+    """Hashes of indexed images, searchable by Hamming distance."""
+    def __init__(self, index_file=INDEX_FILE):
+        self.index_file = index_file
+        self.entries = []  # (hash, source, name)
+        self.names = set()  # (source, name)
+        self.bands = [defaultdict(list) for _ in range(BANDS)]
+        self.lock = threading.Lock()
+        if os.path.exists(index_file):
+            with open(index_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 3:
+                        self._insert(int(parts[0], 16), parts[1], parts[2])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, source_name):
+        return source_name in self.names
+
+    def _insert(self, value, source, name):
+        position = len(self.entries)
+        self.entries.append((value, source, name))
+        self.names.add((source, name))
+        for band in range(BANDS):
+            self.bands[band][(value >> (band * BAND_BITS)) & 0xFFFF].append(position)
+
+    def _find(self, value, max_distance):
+        masks = band_masks(max_distance // BANDS)
+        candidates = set()
+        for band in range(BANDS):
+            key = (value >> (band * BAND_BITS)) & 0xFFFF
+            table = self.bands[band]
+            for mask in masks:
+                candidates.update(table.get(key ^ mask, ()))
+        matches = [(hamming(value, self.entries[i][0]), *self.entries[i][1:])
+                   for i in candidates if self.entries[i] is not None]
+        return sorted(match for match in matches if match[0] <= max_distance)
+
+    def _add(self, value, source, name):
+        if (source, name) in self.names:
+            return
+        self._insert(value, source, name)
+        with open(self.index_file, "a", encoding="utf-8") as f:
+            f.write(f"{value:016x}\t{source}\t{name}\n")
+
+    def _rewrite(self):
+        temp_path = self.index_file + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries:
+                if entry is not None:
+                    f.write(f"{entry[0]:016x}\t{entry[1]}\t{entry[2]}\n")
+        os.replace(temp_path, self.index_file)
+
+    def find(self, value, max_distance=MAX_DISTANCE):
+        """Return (distance, source, name) for indexed images within max_distance bits, closest first."""
+        with self.lock:
+            return self._find(value, max_distance)
+
+    def add(self, value, source, name):
+        """Index an image and append it to the index file."""
+        with self.lock:
+            self._add(value, source, name)
+
+    def remove(self, source, names):
+        """Drop images from the index, e.g. files that were deleted, and rewrite the index file."""
+        with self.lock:
+            gone = {(source, name) for name in names} & self.names
+            if not gone:
+                return
+            for position, entry in enumerate(self.entries):
+                if entry is not None and entry[1:] in gone:
+                    self.entries[position] = None  # The band tables still point here, _find skips it
+            self.names -= gone
+            self._rewrite()
+
+    def check_and_add(self, value, source, name, max_distance=MAX_DISTANCE, ignore=(), add_similar=True):
+        """
+        Return the other images similar to this one, leaving out the (source, name) pairs in 
+        ignore, then index it, as one step across threads. With add_similar=False an image 
+        that has matches isn't indexed, for callers that won't keep it.
+        """
+        with self.lock:
+            matches = [match for match in self._find(value, max_distance)
+                       if match[1:] != (source, name) and match[1:] not in ignore]
+            if add_similar or not matches:
+                self._add(value, source, name)
+        return matches
+
+def index_output(index):
+    """Index every image in the story folders that isn't indexed yet, and drop those that are gone."""
+    missing = [name for source, name in index.names if source == "output" and not os.path.exists(name)]
+    index.remove("output", missing)
+    added = 0
+    for story_id in sorted(os.listdir(OUTPUT_FOLDER)):
+        folder = os.path.join(OUTPUT_FOLDER, story_id)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if name.endswith(".jpg") and ("output", path) not in index:
+                try:
+                    index.add(dhash(path), "output", path)
+                    added += 1
+                except OSError as e:
+                    print(f"Could not read {path}: {e}")
+    print(f"Indexed {added} images from {OUTPUT_FOLDER}/, dropped {len(missing)} missing ({len(index)} in the index)")
+
+def index_wiki(index, api_url, interval=WIKI_INTERVAL):
+    """Index every file on the wiki that isn't indexed yet, from a THUMB_WIDTH px thumbnail."""
+    session = requests.Session()
+    params = {
+        'action': 'query',
+        'generator': 'allimages',
+        'gailimit': 50,
+        'prop': 'imageinfo',
+        'iiprop': 'url',
+        'iiurlwidth': THUMB_WIDTH,
+        'format': 'json',
+        'formatversion': 2
+    }
+    added = 0
+    while True:
+        data = session.get(api_url, params=params, timeout=60).json()
+        for page in data.get('query', {}).get('pages', []):
+            name = page['title'].split(':', 1)[1]
+            info = (page.get('imageinfo') or [{}])[0]
+            url = info.get('thumburl') or info.get('url')
+            if ("wiki", name) in index or not url:
+                continue
+            try:
+                response = session.get(url, timeout=60)
+                response.raise_for_status()
+                index.add(dhash(io.BytesIO(response.content)), "wiki", name)
+                added += 1
+            except (requests.RequestException, OSError) as e:
+                print(f"Could not index File:{name}: {e}")
+            time.sleep(interval)
+        if 'continue' not in data:
+            break
+        params.update(data['continue'])
+    print(f"Indexed {added} files from {api_url} ({len(index)} in the index)")
+
+if __name__ == "__main__":
+    if Image is None:
+        print("phash_index.py needs Pillow: pip install Pillow")
+        sys.exit(1)
+
+    api_url = 'https://bahai.media/api.php'
+    interval = WIKI_INTERVAL
+    max_distance = MAX_DISTANCE
+    images = []
+    for arg in sys.argv[1:]:
+        if arg.startswith('-api:'):
+            api_url = arg.split(':', 1)[1]
+        elif arg.startswith('-interval:'):
+            interval = float(arg.split(':', 1)[1])
+        elif arg.startswith('-distance:'):
+            max_distance = int(arg.split(':', 1)[1])
+        elif not arg.startswith('-'):
+            images.append(arg)
+
+    index = PhashIndex()
+    if '-output' in sys.argv:
+        index_output(index)
+    if '-wiki' in sys.argv:
+        index_wiki(index, api_url, interval)
+    for path in images:
+        matches = index.find(dhash(path), max_distance)
+        print(f"{path}: {len(matches)} similar image(s)")
+        for distance, source, name in matches:
+            print(f"  {distance:2d} bits  {source}: {name}")
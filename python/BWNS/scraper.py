@@ -3,16 +3,158 @@ Script purpose is to access a BWNS article, download all the images and associat
 using the first few words of the caption, and separately save the caption in a .txt file that follows
 the bahai.media format for automatic importing of images following the download process.
  
-Usage: python scraper.py <article number start> <article number end>
+Usage: 
+	$ python scraper.py <article number start> <article number end>
+	$ python scraper.py 1000 2000 -workers:4 (Crawl 4 stories at a time, default 3)
+	$ python scraper.py 1000 2000 -page-interval:10 -image-interval:5 (Seconds between requests, default 5 and 2)
+	$ python scraper.py 1000 2000 -recheck (Revalidate finished stories with conditional GETs)
+	$ python scraper.py 1000 2000 -sitemap-only (Treat IDs missing from the sitemap as nonexistent, no probing)
+	$ python scraper.py 1000 2000 -rediscover (Forget which IDs exist and look them up again)
+	$ python scraper.py 1000 2000 -skip-similar (Don't save images that look like one already indexed)
+
+Before any slideshow is fetched, the range is narrowed to story IDs that exist: IDs 
+listed in the site's sitemap, then HEAD probes for the rest. The answers are kept in 
+story-ids.json, so later runs over the same range make no discovery requests (IDs 
+that didn't exist are probed again after 30 days).
+
+Requests are paced per host and per kind: story and slide pages share one budget on 
+news.bahai.org, image downloads have their own budget on the image host. However many 
+stories are crawled at once, no host receives more than one request of each kind per 
+interval. Throughput is printed every 25 stories and at the end, to help tune the 
+intervals.
+
+Each story folder gets a manifest.json recording, per slide, the page and image URLs, 
+their ETag/Last-Modified headers and the files written. Reruns skip finished stories 
+and slides, so an interrupted crawl resumes where it stopped. With -recheck, finished 
+slides are revalidated with conditional GETs instead and only changed ones are fetched. 
+Folders written before manifests existed are picked up too: an image already saved 
+under a slide's name is kept, and only the slide pages are fetched to build the manifest.
+
+Images are streamed to disk and stored once under image-store/ by SHA-256; story folders 
+get hardlinks (copies where hardlinks aren't supported), so a photo reused across 
+stories takes its space once. Captions that sanitize to the same file name get a 
+numbered suffix instead of overwriting each other.
+
+Each new image is also looked up in the perceptual-hash index (phash_index.py, needs 
+Pillow), which catches the same photo at another size or crop, downloaded before or 
+already on bahai.media. Matches are printed and recorded in the manifest as similar_to; 
+with -skip-similar the image is not saved to the story folder at all.
 
 """
 
+import hashlib
+import json
 import os
+import shutil
 import sys
+import tempfile
+import gzip
+from html.parser import HTMLParser
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import requests
 from bs4 import BeautifulSoup
 import re
+import phash_index
+
+NEWS_URL = "https://news.bahai.org"
+PAGE_INTERVAL = 5.0  # Seconds between requests for story/slide pages
+IMAGE_INTERVAL = 2.0  # Seconds between image downloads
+REPORT_EVERY = 25  # Stories
+MANIFEST_NAME = "manifest.json"
+STORE_DIR = "image-store"  # Images by SHA-256, hardlinked into output/<story_id>/
+CHUNK_SIZE = 64 * 1024
+DISCOVERY_FILE = "story-ids.json"  # Which story IDs exist, kept between runs
+MISSING_RECHECK = 30 * 24 * 3600  # Seconds before an ID that didn't exist is probed again
+SITEMAP_MAX_AGE = 24 * 3600  # Seconds before the sitemap is read again
+
+class PolitenessScheduler:
+    """Hands out request slots so each (kind, host) pair gets at most one request per interval."""
+    def __init__(self, intervals):
+        self.intervals = intervals  # kind -> seconds
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, kind, url):
+        key = (kind, urlparse(url).hostname)
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(key, now))
+            self.next_slot[key] = slot + self.intervals[kind]
+        if slot > now:
+            time.sleep(slot - now)
+
+class CrawlStats:
+    """Counters shared by all workers, for the throughput report."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        self.counts = {"stories": 0, "missing": 0, "slides": 0, "images": 0, "bytes": 0, "cached": 0, "deduplicated": 0, "similar": 0}
+
+    def add(self, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                self.counts[name] += amount
+
+    def report(self):
+        with self.lock:
+            counts = dict(self.counts)
+        minutes = max(time.monotonic() - self.start, 1e-9) / 60
+        print(f"[{minutes:.1f} min] {counts['stories']} stories ({counts['missing']} missing), "
+              f"{counts['slides']} slides, {counts['images']} images, {counts['bytes'] / 1e6:.1f} MB, "
+              f"{counts['cached']} slides/images reused, {counts['deduplicated']} images already stored, "
+              f"{counts['similar']} similar to earlier images | "
+              f"{counts['stories'] / minutes:.1f} stories/min, {counts['images'] / minutes:.1f} images/min, "
+              f"{counts['bytes'] / 1e6 / minutes:.2f} MB/min")
+
+class Crawler:
+    """Everything one crawl shares: the HTTP session, the scheduler and the statistics."""
+    def __init__(self, workers=3, page_interval=PAGE_INTERVAL, image_interval=IMAGE_INTERVAL, recheck=False,
+                 skip_similar=False):
+        self.workers = workers
+        self.recheck = recheck
+        self.skip_similar = skip_similar
+        self.similar_index = phash_index.PhashIndex() if phash_index.Image else None
+        if self.similar_index is None:
+            print("Pillow is not installed, images won't be checked against phash-index.tsv")
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.scheduler = PolitenessScheduler({"page": page_interval, "image": image_interval})
+        self.stats = CrawlStats()
+
+    def get(self, kind, url, **kwargs):
+        self.scheduler.wait(kind, url)
+        return self.session.get(url, timeout=60, **kwargs)
+
+    def find_similar(self, digest, image_filename, previous_files=()):
+        """
+        Return (distance, source, name) for indexed images that look like this one, and index it. 
+        previous_files, the earlier version of the same slide, don't count as matches.
+        """
+        if self.similar_index is None:
+            return []
+        try:
+            value = phash_index.dhash(store_path(digest))
+        except OSError as e:
+            print(f"Could not hash {image_filename}: {e}")
+            return []
+        # With -skip-similar a matching image isn't saved, so it mustn't be indexed either
+        return self.similar_index.check_and_add(value, "output", image_filename,
+                                                ignore={("output", path) for path in previous_files},
+                                                add_similar=not self.skip_similar)
+
+    def forget_images(self, paths):
+        """Drop deleted story images from the similarity index."""
+        if self.similar_index is not None:
+            self.similar_index.remove("output", paths)
+
+    def head(self, kind, url, **kwargs):
+        self.scheduler.wait(kind, url)
+        return self.session.head(url, timeout=60, allow_redirects=True, **kwargs)
 
 def sanitize_filename(text, max_length=55):
     """Sanitize filename by keeping only alphanumeric and common punctuation."""
@@ -39,10 +181,169 @@ def sanitize_filename(text, max_length=55):
     text = text.rstrip(', ')
     return text
 
-def download_images_and_captions(story_id):
-    """Download images and captions from slideshow."""
-    base_url = f"https://news.bahai.org/story/{story_id}/slideshow/"
-    output_dir = os.path.join("output", str(story_id))
+def story_dir(story_id):
+    return os.path.join("output", str(story_id))
+
+def load_manifest(story_id):
+    """
+    Return what earlier runs recorded about a story's slides. A folder with images but no 
+    manifest was written before manifests existed, and its images are adopted as they are found.
+    """
+    path = os.path.join(story_dir(story_id), MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    folder = story_dir(story_id)
+    legacy = os.path.isdir(folder) and any(name.endswith(".jpg") for name in os.listdir(folder))
+    return {"story_id": story_id, "complete": False, "slides": {}, "legacy": legacy}
+
+def save_manifest(story_id, manifest):
+    """Write the manifest atomically, so an interrupted run never leaves it half written."""
+    path = os.path.join(story_dir(story_id), MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def slide_finished(output_dir, entry):
+    """A slide is finished when it was fully processed and all its files are still there."""
+    return bool(entry.get("done")) and all(os.path.exists(os.path.join(output_dir, name)) for name in entry["files"])
+
+def conditional_headers(etag, last_modified):
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+def store_path(digest):
+    return os.path.join(STORE_DIR, digest[:2], f"{digest}.jpg")
+
+def download_to_store(response):
+    """Stream an image response into the store and return its SHA-256.
+    
+    The image is written in chunks to a temporary file while being hashed, then renamed 
+    to its content address, so memory use doesn't grow with the image size and a photo 
+    reused by several stories is stored once."""
+    os.makedirs(STORE_DIR, exist_ok=True)
+    sha256 = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=STORE_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                tmp_file.write(chunk)
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+        path = store_path(digest)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            return digest, False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return digest, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def link_from_store(digest, filename):
+    """Put a stored image at filename, as a hardlink where the filesystem allows it."""
+    tmp_path = filename + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(store_path(digest), tmp_path)
+    except OSError:
+        shutil.copyfile(store_path(digest), tmp_path)
+    os.replace(tmp_path, filename)
+
+def unique_name(manifest, slide_number, base):
+    """Return base, or base_2, base_3... if another slide of the story already uses that name."""
+    used = {name for number, entry in manifest["slides"].items() if number != str(slide_number) 
+            for name in entry.get("files", [])}
+    name, suffix = base, 2
+    while f"{name}.jpg" in used or f"{name}.txt" in used:
+        name = f"{base}_{suffix}"
+        suffix += 1
+    return name
+
+class HeadMetaParser(HTMLParser):
+    """Collects the description and og:image meta tags, stopping at the end of <head>."""
+    class Done(Exception):
+        pass
+
+    def __init__(self):
+        super().__init__()
+        self.description = None
+        self.image = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            raise self.Done()
+        if tag != "meta":
+            return
+        attrs = dict(attrs)
+        if attrs.get("name") == "description" and self.description is None:
+            self.description = attrs.get("content")
+        elif attrs.get("property") == "og:image" and self.image is None:
+            self.image = attrs.get("content")
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            raise self.Done()
+
+def extract_slide_head(html):
+    """Return (caption, image_url) from the <head> meta tags alone, or None when either tag is missing or empty."""
+    parser = HeadMetaParser()
+    head_end = html.lower().find("</head")
+    try:
+        parser.feed(html if head_end == -1 else html[:head_end])
+        parser.close()
+    except HeadMetaParser.Done:
+        pass
+    caption = (parser.description or "").strip()
+    image_url = (parser.image or "").split("?")[0].strip()
+    if not caption or not image_url:
+        return None
+    return caption, image_url
+
+def extract_slide_full(html):
+    """Return (caption, image_url) from a fully parsed slide page; either may be None."""
+    soup = BeautifulSoup(html, 'html.parser')
+    
+    # Extract from meta tags first
+    meta_desc = soup.find("meta", attrs={"name": "description"})
+    meta_image = soup.find("meta", attrs={"property": "og:image"})
+    caption = meta_desc["content"].strip() if meta_desc else None
+    image_url = meta_image["content"].split("?")[0] if meta_image else None
+    
+    # Fallback to .narrative div
+    if not image_url:
+        narrative = soup.find("div", class_="narrative")
+        if narrative:
+            caption_tag = narrative.find("p")
+            download_link = narrative.find("p", class_="download-hires")
+            if caption_tag:
+                caption = caption_tag.get_text(strip=True)
+            if download_link and download_link.a:
+                image_url = download_link.a["href"].split("?")[0]
+    return caption, image_url
+
+def extract_slide(html):
+    """Return (caption, image_url) from a slide page; either may be None.
+    
+    Nearly every slide carries both meta tags in <head>, so the body is only parsed 
+    (with BeautifulSoup) when one of them is missing."""
+    return extract_slide_head(html) or extract_slide_full(html)
+
+def download_images_and_captions(story_id, crawler, manifest):
+    """Download images and captions from slideshow.
+    
+    Slides the manifest marks as done are skipped, or revalidated with conditional 
+    GETs when crawler.recheck is set. The manifest is saved after every slide."""
+    base_url = f"{NEWS_URL}/story/{story_id}/slideshow/"
+    output_dir = story_dir(story_id)
     os.makedirs(output_dir, exist_ok=True)
     
     slide_number = 1
@@ -50,59 +351,118 @@ def download_images_and_captions(story_id):
     
     while True:
         url = f"{base_url}{slide_number}/"
+        previous = manifest["slides"].get(str(slide_number), {})
+        finished = slide_finished(output_dir, previous)
+        if finished and not crawler.recheck:
+            article_has_images = article_has_images or bool(previous["files"])
+            crawler.stats.add(cached=1)
+            slide_number += 1
+            continue
         try:
-            response = requests.get(url)
-            if response.status_code != 200:
+            headers = conditional_headers(previous.get("etag"), previous.get("last_modified")) if finished else {}
+            response = crawler.get("page", url, headers=headers)
+            if response.status_code == 304:
+                article_has_images = article_has_images or bool(previous["files"])
+                crawler.stats.add(cached=1)
+                slide_number += 1
+                continue
+            if response.status_code in (404, 410):
                 print(f"No more slides found for article {story_id}")
+                manifest["complete"] = True
+                manifest["slide_count"] = slide_number - 1
                 break
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract from meta tags first
-            meta_desc = soup.find("meta", attrs={"name": "description"})
-            meta_image = soup.find("meta", attrs={"property": "og:image"})
-            caption = meta_desc["content"].strip() if meta_desc else None
-            image_url = meta_image["content"].split("?")[0] if meta_image else None
+            if response.status_code != 200:
+                # Rate limited or a server error, leave the story incomplete so the next run resumes it
+                print(f"Error {response.status_code} for slide {slide_number} of article {story_id}, stopping here")
+                manifest["complete"] = False
+                break
+            crawler.stats.add(slides=1)
             
-            # Fallback to .narrative div
-            if not image_url:
-                narrative = soup.find("div", class_="narrative")
-                if narrative:
-                    caption_tag = narrative.find("p")
-                    download_link = narrative.find("p", class_="download-hires")
-                    if caption_tag:
-                        caption = caption_tag.get_text(strip=True)
-                    if download_link and download_link.a:
-                        image_url = download_link.a["href"].split("?")[0]
+            caption, image_url = extract_slide(response.text)
+            entry = {
+                "page_url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "image_url": image_url,
+                "caption": caption,
+                "files": [],
+                "done": False,
+            }
             
             # Skip if no image URL found
             if not image_url:
                 print(f"Skipping slide {slide_number} of article {story_id}: No image found.")
+                entry["done"] = True
+                manifest["slides"][str(slide_number)] = entry
+                save_manifest(story_id, manifest)
                 slide_number += 1
-                time.sleep(15)  # 15 second delay between fetching images
                 continue
             
             article_has_images = True
+            skipped = False
+            keep_previous = False
             
             # Create filenames - if caption exists, use it for the filename, otherwise use a generic name
             if caption:
-                filename_base = sanitize_filename(caption)
-                image_filename = os.path.join(output_dir, f"{filename_base}.jpg")
+                # Captions that sanitize to the same name get a numbered suffix instead of overwriting
+                filename_base = unique_name(manifest, slide_number, sanitize_filename(caption))
+                image_name = f"{filename_base}.jpg"
             else:
-                image_filename = os.path.join(output_dir, f"slide_{slide_number}.jpg")
+                image_name = f"slide_{slide_number}.jpg"
+            image_filename = os.path.join(output_dir, image_name)
             
-            # Download the image
-            img_response = requests.get(image_url)
-            if img_response.status_code == 200:
-                with open(image_filename, "wb") as img_file:
-                    img_file.write(img_response.content)
-                print(f"Saved image: {image_filename}")
+            # Download the image, revalidating the copy we already have if it is the same image
+            same_image = previous.get("image_url") == image_url and os.path.exists(image_filename)
+            headers = conditional_headers(previous.get("image_etag"), previous.get("image_last_modified")) if same_image else {}
+            # An image the old scraper saved under this slide's name needs no download
+            adopt = manifest.get("legacy") and not previous and os.path.exists(image_filename)
+            if adopt:
+                entry["files"].append(image_name)
+                crawler.stats.add(cached=1)
+                print(f"Image already saved: {image_filename}")
             else:
-                print(f"Failed to download image: {image_url}")
+                with crawler.get("image", image_url, headers=headers, stream=True) as img_response:
+                    if img_response.status_code == 304:
+                        for key in ("image_etag", "image_last_modified", "sha256"):
+                            entry[key] = previous.get(key)
+                        entry["files"].append(image_name)
+                        crawler.stats.add(cached=1)
+                        print(f"Image unchanged: {image_filename}")
+                    elif img_response.status_code == 200:
+                        digest, new_file = download_to_store(img_response)
+                        entry["image_etag"] = img_response.headers.get("ETag")
+                        entry["image_last_modified"] = img_response.headers.get("Last-Modified")
+                        entry["sha256"] = digest
+                        crawler.stats.add(images=1, bytes=os.path.getsize(store_path(digest)), deduplicated=0 if new_file else 1)
+                    
+                        # Flag photos already downloaded or on bahai.media at another size or crop
+                        previous_files = {os.path.join(output_dir, name) for name in previous.get("files", [])}
+                        similar = crawler.find_similar(digest, image_filename, previous_files)
+                        if similar:
+                            entry["similar_to"] = [f"{source}:{name} ({distance} bits)" for distance, source, name in similar]
+                            crawler.stats.add(similar=1)
+                            print(f"Image for slide {slide_number} of article {story_id} looks like: {', '.join(entry['similar_to'])}")
+                        if similar and crawler.skip_similar:
+                            skipped = True
+                            print(f"Not saving {image_filename}")
+                        else:
+                            link_from_store(digest, image_filename)
+                            entry["files"].append(image_name)
+                            print(f"Saved image: {image_filename}")
+                    else:
+                        print(f"Failed to download image: {image_url}")
+                        # Keep the earlier, good version of the slide rather than deleting its files below
+                        keep_previous = bool(previous.get("files"))
+            
+            if keep_previous:
+                print(f"Keeping the earlier version of slide {slide_number} of article {story_id}")
+                slide_number += 1
+                continue
                 
             # Only create caption text file if a caption exists
-            if caption:
-                text_filename = os.path.join(output_dir, f"{filename_base}.txt")
+            if caption and not skipped:
+                text_name = f"{filename_base}.txt"
+                text_filename = os.path.join(output_dir, text_name)
                 # Format and save caption text in the required format
                 formatted_text = f"""== File info ==
 {{{{cs
@@ -114,60 +474,208 @@ def download_images_and_captions(story_id):
                 
                 with open(text_filename, "w", encoding="utf-8") as text_file:
                     text_file.write(formatted_text)
+                entry["files"].append(text_name)
                 print(f"Saved caption: {text_filename}")
-            else:
+            elif not caption:
                 print(f"No caption for slide {slide_number} of article {story_id}")
             
+            # Files from an older version of this slide (e.g. a changed caption) would otherwise be imported too
+            removed = []
+            for name in set(previous.get("files", [])) - set(entry["files"]):
+                if os.path.exists(os.path.join(output_dir, name)):
+                    os.remove(os.path.join(output_dir, name))
+                    removed.append(os.path.join(output_dir, name))
+            crawler.forget_images(removed)
+            
+            entry["done"] = skipped or image_name in entry["files"]
+            manifest["slides"][str(slide_number)] = entry
+            save_manifest(story_id, manifest)
             slide_number += 1
-            time.sleep(15)  # 15 second delay between fetching images
             
         except Exception as e:
             print(f"Error processing article {story_id}, slide {slide_number}: {e}")
+            manifest["complete"] = False
             break
-            
+    
+    save_manifest(story_id, manifest)
     return article_has_images
 
-def process_article_range(start_id, end_id):
-    """Process a range of articles from start_id to end_id inclusive."""
-    for story_id in range(start_id, end_id + 1):
-        print(f"\nProcessing article {story_id}...")
-        
+def process_article(story_id, crawler):
+    """Download the slideshow of one article that discovery confirmed exists."""
+    print(f"\nProcessing article {story_id}...")
+
+    try:
+        manifest = load_manifest(story_id)
+        finished = all(slide_finished(story_dir(story_id), entry) for entry in manifest["slides"].values())
+        if manifest["complete"] and finished and not crawler.recheck:
+            print(f"Article {story_id} already finished ({manifest.get('slide_count', 0)} slides). Skipping.")
+            crawler.stats.add(stories=1, cached=len(manifest["slides"]))
+            return
+
+        # Download images for this article
+        has_images = download_images_and_captions(story_id, crawler, manifest)
+
+        if not has_images:
+            print(f"No images found for article {story_id}")
+
+    except Exception as e:
+        print(f"Error processing article {story_id}: {e}")
+
+    crawler.stats.add(stories=1)
+    print(f"Completed article {story_id}.")
+
+def load_discovery_cache():
+    if os.path.exists(DISCOVERY_FILE):
+        with open(DISCOVERY_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"sitemap_checked": 0, "stories": {}}
+
+def save_discovery_cache(cache):
+    tmp_path = DISCOVERY_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, DISCOVERY_FILE)
+
+def read_sitemap(crawler, url=None, depth=0):
+    """Return the story IDs listed in the site's sitemap, following sitemap index files."""
+    url = url or f"{NEWS_URL}/sitemap.xml"
+    response = crawler.get("page", url)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code} for {url}")
+    content = response.content
+    if url.endswith(".gz"):
+        content = gzip.decompress(content)
+    story_ids = set()
+    for loc in re.findall(r"<loc>\s*(.*?)\s*</loc>", content.decode("utf-8", "replace")):
+        match = re.search(r"/story/(\d+)(?:/|$)", loc)
+        if match:
+            story_ids.add(int(match.group(1)))
+        elif re.search(r"\.xml(\.gz)?$", loc) and depth < 2:
+            story_ids |= read_sitemap(crawler, loc, depth + 1)
+    return story_ids
+
+def probe_story(story_id, crawler):
+    """Return whether a story exists, from a HEAD request; None if that couldn't be decided."""
+    url = f"{NEWS_URL}/story/{story_id}/"
+    try:
+        response = crawler.head("page", url)
+        if response.status_code == 405:  # HEAD not allowed, ask for the page instead
+            response = crawler.get("page", url, stream=True)
+            response.close()
+    except requests.RequestException as e:
+        print(f"Could not probe article {story_id}: {e}")
+        return None
+    if response.status_code == 200:
+        return True
+    if response.status_code in (404, 410):
+        return False
+    print(f"Could not probe article {story_id}: HTTP {response.status_code}")
+    return None
+
+def discover_story_ids(start_id, end_id, crawler, sitemap_only=False, rediscover=False):
+    """Return the IDs in the range that are real stories.
+    
+    Known stories come from DISCOVERY_FILE. The sitemap is read at most once a day, and 
+    whatever is still unknown is probed with HEAD requests, unless sitemap_only is set. 
+    IDs found missing are probed again after MISSING_RECHECK, in case they were 
+    published since."""
+    cache = load_discovery_cache()
+    stories = cache["stories"]
+    now = time.time()
+
+    def unknown(story_id):
+        entry = stories.get(str(story_id))
+        if rediscover or entry is None:
+            return True
+        return not entry["exists"] and now - entry["checked"] > MISSING_RECHECK
+
+    todo = [story_id for story_id in range(start_id, end_id + 1) if unknown(story_id)]
+    sitemap_read = False
+    # With sitemap_only the sitemap is the only source, so it is always read when anything is unknown
+    if todo and (rediscover or sitemap_only or now - cache["sitemap_checked"] > SITEMAP_MAX_AGE):
+        listed = set()
         try:
-            # Check if article exists
-            url = f"https://news.bahai.org/story/{story_id}/"
-            response = requests.get(url)
-            
-            if response.status_code != 200:
-                print(f"Article {story_id} does not exist. Skipping.")
-                continue
-                
-            # Download images for this article
-            has_images = download_images_and_captions(story_id)
-            
-            if not has_images:
-                print(f"No images found for article {story_id}")
-                
+            listed = read_sitemap(crawler)
+            for story_id in listed:
+                stories[str(story_id)] = {"exists": True, "checked": now}
+            cache["sitemap_checked"] = now
+            sitemap_read = True
+            print(f"Sitemap lists {len(listed)} stories")
         except Exception as e:
-            print(f"Error processing article {story_id}: {e}")
-            
-        print(f"Completed article {story_id}. Waiting 30 seconds before next article...")
-        time.sleep(30)  # 30 second delay between articles
+            print(f"Could not read the sitemap ({e})" + ("" if sitemap_only else ", probing instead"))
+        todo = [story_id for story_id in todo if story_id not in listed]
+
+    if sitemap_only and sitemap_read:
+        for story_id in todo:
+            stories[str(story_id)] = {"exists": False, "checked": now}
+    elif sitemap_only:
+        if todo:
+            print(f"Sitemap unavailable, leaving {len(todo)} story IDs undecided")
+    elif todo:
+        print(f"Probing {len(todo)} story IDs...")
+        with ThreadPoolExecutor(max_workers=crawler.workers) as executor:
+            for done, (story_id, exists) in enumerate(zip(todo, executor.map(lambda i: probe_story(i, crawler), todo)), 1):
+                if exists is not None:
+                    stories[str(story_id)] = {"exists": exists, "checked": time.time()}
+                if done % 100 == 0:
+                    save_discovery_cache(cache)
+    save_discovery_cache(cache)
+
+    story_ids = [story_id for story_id in range(start_id, end_id + 1) if stories.get(str(story_id), {}).get("exists")]
+    crawler.stats.add(missing=end_id - start_id + 1 - len(story_ids))
+    print(f"{len(story_ids)} of {end_id - start_id + 1} story IDs exist")
+    return story_ids
+
+def process_article_range(start_id, end_id, crawler=None, sitemap_only=False, rediscover=False):
+    """Process the articles that exist from start_id to end_id inclusive, several at a time."""
+    crawler = crawler or Crawler()
+    story_ids = discover_story_ids(start_id, end_id, crawler, sitemap_only, rediscover)
+
+    def run(story_id):
+        process_article(story_id, crawler)
+        if crawler.stats.counts["stories"] % REPORT_EVERY == 0:
+            crawler.stats.report()
+
+    with ThreadPoolExecutor(max_workers=crawler.workers) as executor:
+        list(executor.map(run, story_ids))
+    crawler.stats.report()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python main.py <start_story_id> <end_story_id>")
+    options = [arg for arg in sys.argv[1:] if arg.startswith("-") and not arg[1:].isdigit()]
+    positional = [arg for arg in sys.argv[1:] if arg not in options]
+    if len(positional) != 2:
+        print("Usage: python scraper.py <start_story_id> <end_story_id> [-workers:N] [-page-interval:S] [-image-interval:S] [-recheck] [-sitemap-only] [-rediscover] [-skip-similar]")
         sys.exit(1)
         
     try:
-        start_id = int(sys.argv[1])
-        end_id = int(sys.argv[2])
-        
-        if start_id > end_id:
-            print("Error: start_story_id must be less than or equal to end_story_id")
-            sys.exit(1)
-            
-        process_article_range(start_id, end_id)
-        
+        start_id = int(positional[0])
+        end_id = int(positional[1])
     except ValueError:
         print("Error: story IDs must be integers")
         sys.exit(1)
+    if start_id > end_id:
+        print("Error: start_story_id must be less than or equal to end_story_id")
+        sys.exit(1)
+
+    settings = {"workers": 3, "page_interval": PAGE_INTERVAL, "image_interval": IMAGE_INTERVAL,
+                "recheck": "-recheck" in options, "skip_similar": "-skip-similar" in options}
+    for option in options:
+        flag, _, value = option.partition(":")
+        name = flag[1:].replace("-", "_")
+        if name in settings and value:
+            try:
+                settings[name] = type(settings[name])(value)
+            except ValueError:
+                kind = "a whole number" if name == "workers" else "a number of seconds"
+                print(f"Error: {flag} must be {kind}, not '{value}'")
+                sys.exit(1)
+    if settings["workers"] < 1:
+        print("Error: -workers must be at least 1")
+        sys.exit(1)
+    for name in ("page_interval", "image_interval"):
+        if settings[name] < 0:
+            print(f"Error: -{name.replace('_', '-')} can't be negative")
+            sys.exit(1)
+
+    process_article_range(start_id, end_id, Crawler(**settings),
+                          sitemap_only="-sitemap-only" in options, rediscover="-rediscover" in options)
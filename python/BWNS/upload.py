@@ -0,0 +1,238 @@
+r"""
+Uploads the images scraper.py saved in output/<story_id>/ to bahai.media, each with the
+{{cs}} page text from the .txt file next to it. Images without a .txt file (slides that
+had no caption) are listed and left for a manual import.
+
+Be sure to replace your username and password below.
+
+Usage:
+	$ python upload.py (Uploads every story folder in output/)
+	$ python upload.py 1001 1003 (Uploads only these stories)
+	$ python upload.py -workers:4 (Uploads 4 files at a time, default 3)
+	$ python upload.py -chunk:2 (Files over 2 MB are sent in 2 MB chunks, default 4)
+	$ python upload.py -api:http://localhost:8080/api.php (Use a different api, e.g. ../mock_api.py)
+
+Before any bytes are sent, each image's SHA-1 is looked up with list=allimages&aisha1=,
+and images the wiki already has (under any name) are skipped. Finished uploads are
+recorded in uploaded.journal, so reruns skip them without asking the wiki at all. The
+same photo hardlinked into several story folders (see scraper.py) is uploaded once.
+
+The login is kept in wiki-session-cache.json between runs (see ../wiki_session.py).
+"""
+
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from wiki_session import WikiSession, Throttle, retry_after
+
+username = 'David'
+password = 'replaceme'
+
+OUTPUT_FOLDER = "output"
+JOURNAL_FILE = "uploaded.journal"  # Lines of "<sha1>\t<file name>" for files known to be on the wiki
+COMMENT = "Image from the Baha'i World News Service"
+MAXLAG = 5
+MAX_RETRIES = 5
+CHUNK_MB = 4
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def collect_uploads(story_ids=None):
+    """Return (image path, text path) pairs from the story folders, and the images that have no text."""
+    pairs, uncaptioned = [], []
+    folders = story_ids or sorted(name for name in os.listdir(OUTPUT_FOLDER) if name.isdigit())
+    for story_id in folders:
+        folder = os.path.join(OUTPUT_FOLDER, str(story_id))
+        if not os.path.isdir(folder):
+            print(f"No folder for story {story_id}")
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith(".jpg"):
+                continue
+            text_path = os.path.join(folder, name[:-4] + ".txt")
+            if os.path.exists(text_path):
+                pairs.append((os.path.join(folder, name), text_path))
+            else:
+                uncaptioned.append(os.path.join(folder, name))
+    return pairs, uncaptioned
+
+def load_journal():
+    if not os.path.exists(JOURNAL_FILE):
+        return {}
+    with open(JOURNAL_FILE, "r", encoding="utf-8") as f:
+        return dict(line.rstrip("\n").split("\t", 1) for line in f if "\t" in line)
+
+class Uploader:
+    """Uploads files through one WikiSession, sharing a maxlag throttle and the journal between workers."""
+    def __init__(self, wiki, chunk_size, workers):
+        self.wiki = wiki
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.throttle = Throttle()
+        self.journal = load_journal()
+        self.lock = threading.Lock()
+        self.counts = {"uploaded": 0, "journal": 0, "on wiki": 0, "copies": 0, "failed": 0, "bytes": 0}
+        wiki.mount(requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def record(self, sha1, filename):
+        """Add an upload to the journal, on disk first so an interruption doesn't lose it."""
+        with self.lock:
+            self.journal[sha1] = filename
+            with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
+                f.write(f"{sha1}\t{filename}\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def find_on_wiki(self, sha1):
+        """Return the name of a file on the wiki with this SHA-1, or None."""
+        response = self.wiki.get({
+            'action': 'query',
+            'list': 'allimages',
+            'aisha1': sha1,
+            'ailimit': 1,
+            'format': 'json',
+            'formatversion': 2
+        })
+        images = response.json().get('query', {}).get('allimages', [])
+        return images[0]['name'] if images else None
+
+    def post(self, data, files):
+        """POST one upload request, waiting out maxlag and overload like the other api scripts."""
+        data = {**data, 'action': 'upload', 'maxlag': MAXLAG, 'format': 'json'}
+        for attempt in range(MAX_RETRIES):
+            self.throttle.wait()
+            response = self.wiki.post(data, files=files)
+            if response.status_code in (429, 503):
+                self.throttle.pause(retry_after(response))
+                continue
+            result = response.json()
+            if result.get('error', {}).get('code') == 'maxlag':
+                self.throttle.pause(retry_after(response))
+                continue
+            return result
+        return {'error': {'code': 'maxretries', 'info': f'Gave up after {MAX_RETRIES} attempts'}}
+
+    def send(self, path, filename, text):
+        """Upload a file, in chunks through the upload stash when it is larger than chunk_size."""
+        size = os.path.getsize(path)
+        page = {'filename': filename, 'text': text, 'comment': COMMENT}
+        with open(path, "rb") as f:
+            if size <= self.chunk_size:
+                self.count("bytes", size)
+                return self.post(page, {'file': (filename, f.read(), 'image/jpeg')})
+
+            filekey, offset = None, 0
+            while offset < size:
+                f.seek(offset)
+                chunk = f.read(self.chunk_size)
+                data = {'filename': filename, 'filesize': size, 'offset': offset, 'stash': 1}
+                if filekey:
+                    data['filekey'] = filekey
+                result = self.post(data, {'chunk': (filename, chunk, 'application/octet-stream')})
+                if 'upload' not in result:
+                    return result
+                self.count("bytes", len(chunk))
+                filekey = result['upload']['filekey']
+                if result['upload']['result'] == 'Success':
+                    break
+                offset = result['upload']['offset']
+        return self.post({**page, 'filekey': filekey}, None)
+
+    def hash_image(self, image_path):
+        try:
+            return file_sha1(image_path)
+        except OSError as e:
+            print(f"Error uploading {image_path}: {e}")
+            self.count("failed")
+            return None
+
+    def upload(self, image_path, text_path, sha1):
+        filename = os.path.basename(image_path)
+        try:
+            if sha1 in self.journal:
+                self.count("journal")
+                return
+            existing = self.find_on_wiki(sha1)
+            if existing:
+                print(f"Skipping {image_path}: already on the wiki as File:{existing}")
+                self.record(sha1, existing)
+                self.count("on wiki")
+                return
+
+            with open(text_path, "r", encoding="utf-8") as f:
+                text = f.read()
+            result = self.send(image_path, filename, text)
+            upload = result.get('upload', {})
+            if upload.get('result') == 'Success':
+                print(f"Uploaded File:{upload.get('filename', filename)}")
+                self.record(sha1, upload.get('filename', filename))
+                self.count("uploaded")
+            elif upload.get('result') == 'Warning':
+                print(f"Not uploaded {image_path}: {upload['warnings']}")
+                self.count("failed")
+            else:
+                print(f"Error uploading {image_path}: {result.get('error', result)}")
+                self.count("failed")
+        except Exception as e:
+            print(f"Error uploading {image_path}: {e}")
+            self.count("failed")
+
+    def upload_all(self, pairs):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Identical photos would otherwise race past find_on_wiki and be sent twice
+            first = {}
+            for (image_path, text_path), sha1 in zip(pairs, executor.map(lambda pair: self.hash_image(pair[0]), pairs)):
+                if sha1 is None:
+                    continue
+                if sha1 in first:
+                    print(f"Skipping {image_path}: same file as {first[sha1][0]}")
+                    self.count("copies")
+                    continue
+                first[sha1] = (image_path, text_path)
+            list(executor.map(lambda item: self.upload(*item[1], item[0]), first.items()))
+
+def parse_args(args):
+    api_url = 'https://bahai.media/api.php'
+    workers = 3
+    chunk_mb = CHUNK_MB
+    story_ids = []
+    for arg in args:
+        if arg.startswith('-workers:'):
+            workers = max(1, int(arg.split(':', 1)[1]))
+        elif arg.startswith('-chunk:'):
+            chunk_mb = float(arg.split(':', 1)[1])
+        elif arg.startswith('-api:'):
+            api_url = arg.split(':', 1)[1]
+        elif arg.isdigit():
+            story_ids.append(arg)
+    return api_url, workers, int(chunk_mb * 1024 * 1024), story_ids
+
+if __name__ == "__main__":
+    api_url, workers, chunk_size, story_ids = parse_args(sys.argv[1:])
+    pairs, uncaptioned = collect_uploads(story_ids)
+    for path in uncaptioned:
+        print(f"No caption file for {path}, upload it by hand")
+
+    uploader = Uploader(WikiSession(api_url, username, password), chunk_size, workers)
+    start = time.monotonic()
+    uploader.upload_all(pairs)
+    elapsed = time.monotonic() - start
+    counts = uploader.counts
+    print(f"{len(pairs)} files: {counts['uploaded']} uploaded, {counts['on wiki']} already on the wiki, "
+          f"{counts['journal']} in the journal, {counts['copies']} duplicate(s), {counts['failed']} failed. "
+          f"Sent {counts['bytes'] / 1e6:.1f} MB in {elapsed:.1f}s ({workers} worker(s))")
@@ -8,11 +8,36 @@ Created author Philip Nash (Q834)
 
 Be sure to replace your username and password below.
 
-Usage: python api_addpages_works.py
+Usage: 
+	$ python api_addpages_works.py (Creates pages one after another)
+	$ python api_addpages_works.py -workers:8 (Creates pages with 8 concurrent workers)
+	$ python api_addpages_works.py -api:http://localhost:8080/api.php (Use a different api, e.g. mock_api.py)
+	$ python api_addpages_works.py -nocheck (Edit every page without first checking what is already on the wiki)
+
+All workers share one throttle, so a maxlag error or a Retry-After header from the 
+server pauses every worker, not only the one that received it.
+
+Before editing, the current revision of every page is looked up 50 titles at a time. Pages 
+that already exist with the same text are skipped, so rerunning a mostly finished 
+needed-authors.txt costs a few reads instead of thousands of edits.
+
+The login is kept in wiki-session-cache.json between runs (see wiki_session.py).
 """
 
-import requests
+import hashlib
 import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from wiki_session import WikiSession, Throttle, retry_after
+
+username = 'David'
+password = 'replaceme'
+
+MAXLAG = 5  # Seconds of replication lag after which the server asks us to back off
+MAX_RETRIES = 5
+QUERY_BATCH_SIZE = 50  # Most titles a regular account may ask for in one query
 
 def process_line(line):
     match = re.search(r'Created author (.*?) \((Q\d+)\)', line)
@@ -31,58 +56,121 @@ def format_author_page(name, identifier):
 __NOTOC__
 """
 
-def get_csrf_token(session, api_url):
-    # Get login token
-    login_token_response = session.get(api_url, params={
-        'action': 'query',
-        'meta': 'tokens',
-        'type': 'login',
-        'format': 'json'
-    })
-    login_token = login_token_response.json()['query']['tokens']['logintoken']
-
-    # Perform login
-    login_response = session.post(api_url, data={
-        'action': 'login',
-        'lgname': 'David',
-        'lgpassword': 'replaceme',
-        'lgtoken': login_token,
-        'format': 'json'
-    })
+def content_sha1(text):
+    # MediaWiki strips trailing whitespace when saving, so hash the text the way it will be stored
+    return hashlib.sha1(text.rstrip().encode('utf-8')).hexdigest()
 
-    # Get CSRF token
-    csrf_token_response = session.get(api_url, params={
-        'action': 'query',
-        'meta': 'tokens',
-        'format': 'json'
-    })
-    return csrf_token_response.json()['query']['tokens']['csrftoken']
+def get_page_hashes(wiki, titles):
+    """Return {title: sha1 of current content} for the titles that exist, querying 50 at a time."""
+    hashes = {}
+    for start in range(0, len(titles), QUERY_BATCH_SIZE):
+        batch = titles[start:start + QUERY_BATCH_SIZE]
+        data = wiki.post({
+            'action': 'query',
+            'titles': '|'.join(batch),
+            'prop': 'revisions',
+            'rvprop': 'sha1',
+            'rvslots': 'main',
+            'formatversion': 2,
+            'format': 'json'
+        }).json()
+
+        # Titles can come back normalized (e.g. underscores to spaces), map them back to ours
+        query = data.get('query', {})
+        original = {entry['to']: entry['from'] for entry in query.get('normalized', [])}
+        for page in query.get('pages', []):
+            if page.get('missing') or not page.get('revisions'):
+                continue
+            title = original.get(page['title'], page['title'])
+            hashes[title] = page['revisions'][0]['slots']['main']['sha1']
+    return hashes
+
+def filter_unchanged(wiki, authors):
+    """Drop (name, identifier) pairs whose page already holds exactly the text we would write."""
+    titles = [f"Author:{name}" for name, identifier in authors]
+    hashes = get_page_hashes(wiki, titles)
+    needed = [
+        (name, identifier) for name, identifier in authors
+        if hashes.get(f"Author:{name}") != content_sha1(format_author_page(name, identifier))
+    ]
+    print(f"Precheck: {len(authors) - len(needed)} page(s) already up to date, {len(needed)} to edit "
+          f"({-(-len(titles) // QUERY_BATCH_SIZE)} query request(s)).")
+    return needed
 
-def create_page(session, api_url, title, content, csrf_token):
+def create_page(wiki, title, content, throttle=None):
     create_params = {
         'action': 'edit',
         'title': title,
         'text': content,
-        'token': csrf_token,
+        'maxlag': MAXLAG,
         'format': 'json'
     }
-    return session.post(api_url, data=create_params).json()
+    throttle = throttle or Throttle()
+    for attempt in range(MAX_RETRIES):
+        throttle.wait()
+        response = wiki.post(create_params)
+
+        # The server is overloaded or lagged, everyone waits before trying again
+        if response.status_code in (429, 503):
+            throttle.pause(retry_after(response))
+            continue
+        result = response.json()
+        if result.get('error', {}).get('code') == 'maxlag':
+            throttle.pause(retry_after(response))
+            continue
+        return result
+    return {'error': {'code': 'maxretries', 'info': f'Gave up after {MAX_RETRIES} attempts'}}
+
+def create_author_page(wiki, name, identifier, throttle):
+    page_title = f"Author:{name}"
+    page_content = format_author_page(name, identifier)
+    response = create_page(wiki, page_title, page_content, throttle)
+    if 'error' in response:
+        print(f"Error creating page for {name}: {response['error']}")
+        return False
+    print(f"Page created for {name}: {response}")
+    return True
+
+def create_author_pages(wiki, authors, workers=1):
+    """Create pages for (name, identifier) pairs using a pool of workers, returns the number created."""
+    throttle = Throttle()
+    # Let every worker keep its own keep-alive connection
+    wiki.mount(requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(
+            lambda author: create_author_page(wiki, *author, throttle),
+            authors
+        )
+        return sum(results)
+
+def parse_args(args):
+    api_url = 'https://bahai.works/api.php'
+    workers = 1
+    precheck = True
+    for arg in args:
+        if arg.startswith('-workers:'):
+            workers = max(1, int(arg.split(':', 1)[1]))
+        elif arg.startswith('-api:'):
+            api_url = arg.split(':', 1)[1]
+        elif arg == '-nocheck':
+            precheck = False
+    return api_url, workers, precheck
 
 # Main process
-api_url = 'https://bahai.works/api.php'
-session = requests.Session()
-csrf_token = get_csrf_token(session, api_url)
-
-input_file = 'needed-authors.txt'
-with open(input_file, 'r') as file:
-    for line in file:
-        name, identifier = process_line(line)
-        if name and identifier:
-            page_title = f"Author:{name}"
-            page_content = format_author_page(name, identifier)
-            response = create_page(session, api_url, page_title, page_content, csrf_token)
-            if 'error' in response:
-                print(f"Error creating page for {name}: {response['error']}")
-            else:
-                print(f"Page created for {name}: {response}")
+if __name__ == "__main__":
+    api_url, workers, precheck = parse_args(sys.argv[1:])
+    wiki = WikiSession(api_url, username, password)
+
+    input_file = 'needed-authors.txt'
+    with open(input_file, 'r') as file:
+        authors = [author for author in map(process_line, file) if author[0] and author[1]]
+    total = len(authors)
+    if precheck:
+        authors = filter_unchanged(wiki, authors)
 
+    start = time.monotonic()
+    created = create_author_pages(wiki, authors, workers)
+    elapsed = time.monotonic() - start
+    print(f"Created {created} of {len(authors)} pages ({total - len(authors)} skipped) in {elapsed:.1f}s "
+          f"({created / elapsed if elapsed else 0:.2f} pages/second, {workers} worker(s))")
@@ -4,83 +4,124 @@ from needed-books.txt, a file which should look something like this:
 
 Created 239 Days (Q6135)
 
-Be sure to replace your username and password below.
+Be sure to replace your username and password below. The login is kept in 
+wiki-session-cache.json between runs (see wiki_session.py).
 
-Usage: python api_addsitelinks_data-bookformat.py
+Each line is appended to needed-books.journal as soon as its sitelink is set. If the 
+script is stopped or crashes, running it again skips everything in the journal. Once 
+all lines have been tried, the finished ones are removed from needed-books.txt.
+
+Before writing, the current works sitelink of every item is fetched 50 at a time. Items 
+already linked to the right page are marked done without a write, and items linked to 
+a different page are reported and left alone.
+
+Usage: 
+	$ python api_addsitelinks_data-bookformat.py
+	$ python api_addsitelinks_data-bookformat.py -compact (Only remove journaled lines from needed-books.txt)
+	$ python api_addsitelinks_data-bookformat.py -api:http://localhost:8080/api.php (Use a different api, e.g. mock_api.py)
 """
 
-import requests
+import os
 import re
+import sys
+from sitelinks import sort_by_sitelink
+from wiki_session import WikiSession
 
 # Parameters for your Wikibase instance
 api_url = 'https://bahaidata.org/api.php'
 username = 'changeme'
 password = 'changeme'
 
+input_file = 'needed-books.txt'
+journal_file = 'needed-books.journal'  # One line per book whose sitelink has been set
+
 # Function to set a sitelink for a given item
-def set_sitelink(session, item_id, site_id, page_title, csrf_token):
+def set_sitelink(wiki, item_id, site_id, page_title):
     params = {
         'action': 'wbsetsitelink',
         'id': item_id,
         'linksite': site_id,
         'linktitle': page_title,
-        'token': csrf_token,
         'format': 'json'
     }
-    response = session.post(api_url, data=params)
+    response = wiki.post(params)
     return response.json()
 
-# Start a session to maintain cookies
-session = requests.Session()
-
-# Step 1: Get login token
-login_token_response = session.get(api_url, params={
-    'action': 'query',
-    'meta': 'tokens',
-    'type': 'login',
-    'format': 'json'
-})
-login_token = login_token_response.json()['query']['tokens']['logintoken']
-
-# Step 2: Perform login
-login_response = session.post(api_url, data={
-    'action': 'login',
-    'lgname': username,
-    'lgpassword': password,
-    'lgtoken': login_token,
-    'format': 'json'
-})
-
-# Step 3: Get CSRF token
-csrf_token_response = session.get(api_url, params={
-    'action': 'query',
-    'meta': 'tokens',
-    'format': 'json'
-})
-csrf_token = csrf_token_response.json()['query']['tokens']['csrftoken']
-
-# Read the list of books from the file and set sitelinks
-with open('needed-books.txt', mode='r', encoding='utf-8') as file:
-    lines = file.readlines()
-
-successful_lines = []
-
-for line in lines:
-    match = re.search(r'Created (.*?) \((Q\d+)\)', line)
-    if match:
-        book_title = match.group(1)
-        item_id = match.group(2)
-        page_title = book_title
-        response = set_sitelink(session, item_id, 'works', page_title, csrf_token)
-
-        # If successful, add line to successful_lines
-        if 'success' in response and response['success'] == 1:
-            successful_lines.append(line)
-        else:
-            print(f"Error setting sitelink for {book_title} ({item_id}):", response)
-
-# Rewrite the file excluding successful lines
-with open('needed-books.txt', mode='w', encoding='utf-8') as file:
+def load_journal(journal_file):
+    """Return the set of lines already recorded as done, so each lookup is O(1)."""
+    try:
+        with open(journal_file, mode='r', encoding='utf-8') as file:
+            return {line.rstrip('\n') for line in file}
+    except FileNotFoundError:
+        return set()
+
+def append_journal(journal, line):
+    # Flush to disk straight away so a crash right after a sitelink is set still remembers it
+    journal.write(line.rstrip('\n') + '\n')
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def compact(input_file, journal_file):
+    """Rewrite input_file without the journaled lines, then start a fresh journal."""
+    done = load_journal(journal_file)
+    with open(input_file, mode='r', encoding='utf-8') as file:
+        lines = file.readlines()
+    remaining = [line for line in lines if line.rstrip('\n') not in done]
+
+    # Write to a temporary file first so an interruption never leaves needed-books.txt half written
+    temp_file = input_file + '.tmp'
+    with open(temp_file, mode='w', encoding='utf-8') as file:
+        file.writelines(remaining)
+    os.replace(temp_file, input_file)
+    if os.path.exists(journal_file):
+        os.remove(journal_file)
+    print(f"Removed {len(lines) - len(remaining)} finished line(s) from {input_file}, {len(remaining)} left.")
+
+def set_sitelinks(wiki, input_file, journal_file):
+    """Set sitelinks for every line not already in the journal, recording each success as it happens."""
+    done = load_journal(journal_file)
+    if done:
+        print(f"Resuming: {len(done)} line(s) already done according to {journal_file}.")
+
+    with open(input_file, mode='r', encoding='utf-8') as file:
+        lines = file.readlines()
+
+    entries = []
     for line in lines:
-        if line not in successful_lines:
-            file.write(line)
+        if line.rstrip('\n') in done:
+            continue
+        match = re.search(r'Created (.*?) \((Q\d+)\)', line)
+        if match:
+            book_title = match.group(1)
+            item_id = match.group(2)
+            page_title = book_title
+            entries.append((item_id, page_title, line))
+
+    # Only items without a works sitelink need a write
+    correct, conflicting, missing = sort_by_sitelink(wiki, entries, 'works')
+
+    with open(journal_file, mode='a', encoding='utf-8') as journal:
+        for item_id, page_title, line in correct:
+            append_journal(journal, line)
+
+        for item_id, page_title, line in missing:
+            response = set_sitelink(wiki, item_id, 'works', page_title)
+
+            # If successful, record the line in the journal
+            if 'success' in response and response['success'] == 1:
+                append_journal(journal, line)
+            else:
+                print(f"Error setting sitelink for {page_title} ({item_id}):", response)
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        if arg.startswith('-api:'):
+            api_url = arg.split(':', 1)[1]
+
+    if '-compact' not in sys.argv[1:]:
+        # Logs in on the first write, or reuses the login saved by an earlier run
+        wiki = WikiSession(api_url, username, password)
+        set_sitelinks(wiki, input_file, journal_file)
+
+    # Rewrite the file excluding successful lines
+    compact(input_file, journal_file)
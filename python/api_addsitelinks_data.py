@@ -6,62 +6,48 @@ Created author Everett Tabor Gamage (Q811)
 Created author A. G. B. (Q831)
 Created author Philip Nash (Q834)
 
-Be sure to replace your username and password below.
+Be sure to replace your username and password below. The login is kept in 
+wiki-session-cache.json between runs (see wiki_session.py).
 
-Usage: python api_addsitelinks_data.py
+Items that already link to the right page are skipped, and items that link to 
+a different page are reported and left alone.
+
+Usage: 
+	$ python api_addsitelinks_data.py
+	$ python api_addsitelinks_data.py -api:http://localhost:8080/api.php (Use a different api, e.g. mock_api.py)
 """
 
-import requests
 import re
+import sys
+from sitelinks import sort_by_sitelink
+from wiki_session import WikiSession
 
 # Parameters for your Wikibase instance
 api_url = 'https://bahaidata.org/api.php'
 username = 'David'
 password = 'replaceme'
 
+for arg in sys.argv[1:]:
+    if arg.startswith('-api:'):
+        api_url = arg.split(':', 1)[1]
+
 # Function to set a sitelink for a given item
-def set_sitelink(session, item_id, site_id, page_title, csrf_token):
+def set_sitelink(wiki, item_id, site_id, page_title):
     params = {
         'action': 'wbsetsitelink',
         'id': item_id,
         'linksite': site_id,
         'linktitle': page_title,
-        'token': csrf_token,
         'format': 'json'
     }
-    response = session.post(api_url, data=params)
+    response = wiki.post(params)
     return response.json()
 
-# Start a session to maintain cookies
-session = requests.Session()
-
-# Step 1: Get login token
-login_token_response = session.get(api_url, params={
-    'action': 'query',
-    'meta': 'tokens',
-    'type': 'login',
-    'format': 'json'
-})
-login_token = login_token_response.json()['query']['tokens']['logintoken']
-
-# Step 2: Perform login
-login_response = session.post(api_url, data={
-    'action': 'login',
-    'lgname': username,
-    'lgpassword': password,
-    'lgtoken': login_token,
-    'format': 'json'
-})
+# Logs in on the first write, or reuses the login saved by an earlier run
+wiki = WikiSession(api_url, username, password)
 
-# Step 3: Get CSRF token
-csrf_token_response = session.get(api_url, params={
-    'action': 'query',
-    'meta': 'tokens',
-    'format': 'json'
-})
-csrf_token = csrf_token_response.json()['query']['tokens']['csrftoken']
-
-# Read the list of authors from the file and set sitelinks
+# Read the list of authors from the file
+entries = []
 with open('needed-authors.txt', 'r') as file:
     for line in file:
         match = re.search(r'Created author (.*?) \((Q\d+)\)', line)
@@ -69,11 +55,17 @@ with open('needed-authors.txt', 'r') as file:
             author_name = match.group(1)
             item_id = match.group(2)
             page_title = f'Author:{author_name}'
-            response = set_sitelink(session, item_id, 'works', page_title, csrf_token)
+            entries.append((item_id, page_title, author_name))
+
+# Only set sitelinks for items that don't have one yet
+correct, conflicting, missing = sort_by_sitelink(wiki, entries, 'works')
+
+for item_id, page_title, author_name in missing:
+    response = set_sitelink(wiki, item_id, 'works', page_title)
 
-            # Print only if there's an error
-            if 'success' not in response or response['success'] != 1:
-                print(f"Error setting sitelink for {author_name} ({item_id}):", response)
+    # Print only if there's an error
+    if 'success' not in response or response['success'] != 1:
+        print(f"Error setting sitelink for {author_name} ({item_id}):", response)
 
 
 # working so let's keep it just in case
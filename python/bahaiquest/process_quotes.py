@@ -1,20 +1,37 @@
 r"""
 After running search_api.py open each file in the output folder, replace "title" 
 with the mediawiki heading you want to use to group the quotes and reduce the quote down to one sentence, 
-then save those files.
+then save those files. Running shorten_quotes.py first suggests that sentence in "quote_short", 
+which is used instead of "quote" when present.
 
 Running the script will process each text file in the output folder, grouping quotes by title and using the 
-filenames and abbreviation_map to populate the wiki template correctly.
+filenames and abbreviation_map to populate the wiki template correctly. Files can hold either 
+a JSON list or one JSON object per line, which is what search_api.py writes.
 
-Usage: python process_quotes.py
+Only files that changed since the last run are read again. The others are taken from 
+process_quotes_manifest.json, which keeps each file's content hash and parsed quotes. 
+When many files changed they are parsed in parallel. Files are always merged in name 
+order, so output.txt comes out the same however the work was split.
+
+Quotes that appear more than once under the same title (the same paragraph in two 
+compilations) are kept only once, from the book listed earliest in SOURCE_PRIORITY. 
+Each dropped copy is printed so it can be checked (see quote_dedupe.py).
+
+Usage: 
+	$ python process_quotes.py
+	$ python process_quotes.py -keep-duplicates (Skip the duplicate check)
 
 
 """
 
+import hashlib
 import json
 import re
 import os
+import sys
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from quote_dedupe import dedupe_quotes
 
 # Define the mapping for file name components
 abbreviation_map = {
@@ -51,50 +68,111 @@ abbreviation_map = {
     "additional-prayers-revealed-abdul-baha": "APR"
 }
 
+# Which copy of a duplicated quote to keep, most preferred first. Reorder as needed.
+SOURCE_PRIORITY = list(abbreviation_map.values())
+
 # Folder containing the text files
 OUTPUT_FOLDER = "output"
 OUTPUT_FILE = "output.txt"
+MANIFEST_FILE = "process_quotes_manifest.json"  # Content hash and parsed quotes of each file
+POOL_THRESHOLD = 8  # Parse in a process pool once at least this many files changed
+MANIFEST_FORMAT = 2  # Bump when parse_text_file's output changes, so cached quotes are parsed again
+
+
+def read_quotes(text_file):
+    """Returns the list of quotes in a text file, or None if it isn't valid JSON."""
+    with open(text_file, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    try:
+        quotes = json.loads(content)  # Expecting JSON format inside .txt files
+        if isinstance(quotes, list):
+            return quotes
+    except json.JSONDecodeError:
+        pass
 
+    # search_api.py writes one JSON object per line
+    try:
+        return [json.loads(line) for line in content.splitlines() if line.strip()]
+    except json.JSONDecodeError:
+        print(f"Error: Malformed JSON in {text_file}")
+        return None
 
-def process_text_file(text_file, abbreviation, all_quotes):
-    """Processes a text file if it exists, grouping quotes by title."""
-    if not os.path.exists(text_file):
-        print(f"Skipping missing file: {text_file}")
-        return
 
+def format_quote(entry):
+    # Prefer the one-sentence version from shorten_quotes.py unless it was cleared
+    quote = entry.get("quote_short") or entry["quote"]
+    return f"{{{{q|{quote}|{entry['location']} |{entry['abbreviation']} }}}}"
+
+
+def parse_text_file(text_file, abbreviation):
+    """Returns the quotes of one text file as title/quote/quote_short/location/abbreviation dicts, or None."""
     print(f"Processing text file: {text_file}")
 
-    with open(text_file, "r", encoding="utf-8") as f:
-        try:
-            quotes = json.load(f)  # Expecting JSON format inside .txt files
-        except json.JSONDecodeError:
-            print(f"Error: Malformed JSON in {text_file}")
-            return
+    quotes = read_quotes(text_file)
+    if quotes is None:
+        return None
 
     if not quotes:
         print(f"Warning: {text_file} is empty.")
-        return
+        return []
 
     print(f"→ Read {len(quotes)} quotes from {text_file}")
 
-    for entry in quotes:
-        title = entry["title"]
-        quote_entry = f"{{{{q|{entry['quote']}|{entry['location']} |{abbreviation} }}}}"
-        all_quotes[title].append(quote_entry)
+    # Keep the full paragraph for duplicate detection, quote_short is only used for output
+    return [
+        {"title": entry["title"], "quote": entry["quote"], "quote_short": entry.get("quote_short"),
+         "location": entry["location"], "abbreviation": abbreviation}
+        for entry in quotes
+    ]
 
 
-def main():
-    all_quotes = defaultdict(list)
+def file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
 
-    # Get all text files in the output folder
-    text_files = [f for f in os.listdir(OUTPUT_FOLDER) if f.endswith(".txt")]
+def save_manifest(manifest):
+    temp_file = MANIFEST_FILE + ".tmp"
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_file, MANIFEST_FILE)
+
+
+def parse_changed_files(jobs):
+    """Parses (filename, path, abbreviation) jobs, in a process pool when there are many of them."""
+    if len(jobs) < POOL_THRESHOLD:
+        return [parse_text_file(path, abbreviation) for filename, path, abbreviation in jobs]
+    with ProcessPoolExecutor() as executor:
+        # map() keeps the results in the same order as the jobs
+        return list(executor.map(parse_text_file, [job[1] for job in jobs], [job[2] for job in jobs]))
+
+
+def collect_quotes(folder=OUTPUT_FOLDER):
+    """
+    Returns every quote in the folder in a stable order (file name, then position in the 
+    file). Only files whose content changed since the last run are parsed again; the rest 
+    come from the manifest.
+    """
+    # Sorted, so the merged output doesn't depend on the order the file system lists files in
+    text_files = sorted(f for f in os.listdir(folder) if f.endswith(".txt"))
 
     if not text_files:
         print("No text files found in the output folder.")
-        return
+        return []
 
     print(f"Found {len(text_files)} text files.")
 
+    old_manifest = load_manifest()
+    manifest, jobs = {}, []
     for filename in text_files:
         # Extract everything after the first underscore
         match = re.match(r"[^_]+_(.+)\.txt", filename)
@@ -109,8 +187,49 @@ def main():
             continue
 
         abbreviation = abbreviation_map[key]
-        text_file_path = os.path.join(OUTPUT_FOLDER, filename)
-        process_text_file(text_file_path, abbreviation, all_quotes)
+        text_file_path = os.path.join(folder, filename)
+        stat = os.stat(text_file_path)
+        entry = old_manifest.get(filename)
+
+        # Same size and modification time means unchanged, otherwise compare the content hash
+        if entry and entry.get("format") != MANIFEST_FORMAT:
+            entry = None
+        if entry and entry["abbreviation"] == abbreviation and (entry["size"], entry["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            manifest[filename] = entry
+            continue
+        sha256 = file_sha256(text_file_path)
+        if entry and entry["abbreviation"] == abbreviation and entry["sha256"] == sha256:
+            manifest[filename] = {**entry, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            continue
+
+        manifest[filename] = {"sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                              "abbreviation": abbreviation, "format": MANIFEST_FORMAT, "quotes": None}
+        jobs.append((filename, text_file_path, abbreviation))
+
+    print(f"{len(jobs)} changed file(s) to parse, {len(manifest) - len(jobs)} unchanged.")
+    for (filename, path, abbreviation), quotes in zip(jobs, parse_changed_files(jobs)):
+        if quotes is None:
+            del manifest[filename]  # Malformed, try again next time
+        else:
+            manifest[filename]["quotes"] = quotes
+
+    save_manifest(manifest)
+    return [quote for filename in text_files if filename in manifest for quote in manifest[filename]["quotes"]]
+
+
+def main(keep_duplicates=False):
+    entries = collect_quotes()
+    if not keep_duplicates:
+        entries, duplicates = dedupe_quotes(entries, SOURCE_PRIORITY)
+        for kept, dropped in duplicates:
+            for entry in dropped:
+                print(f"Duplicate under '{kept['title']}': dropped {entry['abbreviation']} {entry['location']}, "
+                      f"kept {kept['abbreviation']} {kept['location']}")
+        print(f"Removed {sum(len(dropped) for kept, dropped in duplicates)} duplicate quote(s).")
+
+    all_quotes = defaultdict(list)
+    for entry in entries:
+        all_quotes[entry["title"]].append(format_quote(entry))
 
     # Write to output file
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
@@ -122,4 +241,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    main(keep_duplicates="-keep-duplicates" in sys.argv[1:])
@@ -0,0 +1,125 @@
+r"""
+Finds near-identical quotes, e.g. the same paragraph in Gleanings and in the Tablets, so 
+only one copy ends up on the page.
+
+Each quote is cut into overlapping word shingles and summarised by a MinHash signature 
+(one-permutation hashing: every shingle is hashed once and the smallest hash in each of 
+NUM_BINS bins is kept). Signatures are split into bands and quotes sharing a band land 
+in the same bucket, so only quotes in a shared bucket are ever compared. Those 
+candidates are confirmed with the exact Jaccard similarity of their shingles.
+
+Short quotes leave most bins empty, so empty bins are filled from the next non-empty bin 
+(rotation densification); otherwise every short quote would share the all-empty bands 
+and be compared with every other one. Quotes with fewer than MIN_SHINGLES shingles are 
+only matched when their shingles are identical.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+
+SHINGLE_SIZE = 3  # Words per shingle
+NUM_BINS = 32
+BANDS = 8  # NUM_BINS / BANDS rows per band, candidates from about 0.6 similarity
+THRESHOLD = 0.8  # Jaccard similarity above which two quotes count as the same
+EMPTY_BIN = 2 ** 64
+MIN_SHINGLES = 4  # Fewer than this and a signature says too little, match exactly instead
+
+
+def shingles(text):
+    """Set of word shingles, ignoring case, punctuation and diacritics."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    words = re.findall(r"\w+", text)
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def signature(shingle_set):
+    bins = [EMPTY_BIN] * NUM_BINS
+    for shingle in shingle_set:
+        # Python's own string hash is randomised per process, which is fine as signatures are never stored
+        h = hash(shingle) & 0xFFFFFFFFFFFFFFFF
+        index, value = h % NUM_BINS, h // NUM_BINS
+        if value < bins[index]:
+            bins[index] = value
+    if all(value == EMPTY_BIN for value in bins):
+        return bins
+    # Borrow each empty bin from the next filled one, offset by the distance so borrowed 
+    # values never equal a real one from another bin
+    offset = EMPTY_BIN // NUM_BINS
+    filled = list(bins)
+    for index in range(NUM_BINS):
+        distance = 1
+        while filled[index] == EMPTY_BIN:
+            value = bins[(index + distance) % NUM_BINS]
+            if value != EMPTY_BIN:
+                filled[index] = value + distance * offset
+            distance += 1
+    return filled
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def find_duplicates(texts, threshold=THRESHOLD):
+    """Return clusters (lists of indexes into texts) of two or more near-identical texts."""
+    shingle_sets = [shingles(text) for text in texts]
+    rows = NUM_BINS // BANDS
+    buckets = defaultdict(list)
+    for i, shingle_set in enumerate(shingle_sets):
+        if len(shingle_set) < MIN_SHINGLES:
+            buckets[("exact", frozenset(shingle_set))].append(i)
+            continue
+        bins = signature(shingle_set)
+        for band in range(BANDS):
+            buckets[(band, tuple(bins[band * rows:(band + 1) * rows]))].append(i)
+
+    # Union-find over confirmed pairs
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for members in buckets.values():
+        for a_pos, a in enumerate(members):
+            for b in members[a_pos + 1:]:
+                if (a, b) in checked or find(a) == find(b):
+                    continue
+                checked.add((a, b))
+                if jaccard(shingle_sets[a], shingle_sets[b]) >= threshold:
+                    parent[find(b)] = find(a)
+
+    clusters = defaultdict(list)
+    for i in range(len(texts)):
+        clusters[find(i)].append(i)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def dedupe_quotes(entries, priority, threshold=THRESHOLD):
+    """
+    Drop near-identical quotes within each title, keeping the copy whose abbreviation comes 
+    first in priority (then the first one seen). Returns (kept entries in their original 
+    order, list of (kept entry, dropped entries)).
+    """
+    rank = {abbreviation: position for position, abbreviation in enumerate(priority)}
+    by_title = defaultdict(list)
+    for position, entry in enumerate(entries):
+        by_title[entry["title"]].append(position)
+
+    dropped, report = set(), []
+    for positions in by_title.values():
+        for cluster in find_duplicates([entries[p]["quote"] for p in positions], threshold):
+            cluster = [positions[i] for i in cluster]
+            keep = min(cluster, key=lambda p: (rank.get(entries[p]["abbreviation"], len(rank)), p))
+            others = [p for p in cluster if p != keep]
+            dropped.update(others)
+            report.append((entries[keep], [entries[p] for p in others]))
+
+    return [entry for position, entry in enumerate(entries) if position not in dropped], report
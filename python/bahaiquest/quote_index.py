@@ -0,0 +1,97 @@
+r"""
+A local SQLite full-text index of every paragraph search_api.py has retrieved, so repeat 
+or overlapping searches can be answered without contacting bahai.org.
+
+search_api.py adds paragraphs here as it downloads them. Paragraphs already sitting in 
+the output folder can be added with "python search_api.py -index-output", best done 
+before those files are edited by hand.
+
+Requires an SQLite build with FTS5, which is included with the Python installers.
+"""
+
+import sqlite3
+from process_quotes import abbreviation_map
+
+INDEX_FILE = "library-index.sqlite"
+FTS_OPERATORS = {"AND", "OR", "NOT"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS paragraphs (
+    keyword TEXT NOT NULL,
+    abbreviation TEXT,
+    location TEXT NOT NULL,
+    title TEXT,
+    content TEXT,
+    PRIMARY KEY (keyword, location)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS paragraphs_fts USING fts5(
+    content, content='paragraphs', content_rowid='rowid',
+    tokenize='porter unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS paragraphs_insert AFTER INSERT ON paragraphs BEGIN
+    INSERT INTO paragraphs_fts(rowid, content) VALUES (new.rowid, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS paragraphs_delete AFTER DELETE ON paragraphs BEGIN
+    INSERT INTO paragraphs_fts(paragraphs_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS paragraphs_update AFTER UPDATE ON paragraphs BEGIN
+    INSERT INTO paragraphs_fts(paragraphs_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    INSERT INTO paragraphs_fts(rowid, content) VALUES (new.rowid, new.content);
+END;
+"""
+
+def to_fts_query(query):
+    """
+    Turn a library search like 'faith AND certitude' into FTS5 syntax. Words are quoted so 
+    punctuation can't break the query; AND, OR, NOT and quoted phrases are kept as they are.
+    """
+    if '"' in query:
+        return query
+    words = []
+    for word in query.split():
+        words.append(word if word in FTS_OPERATORS else '"' + word.replace('"', '') + '"')
+    return " ".join(words)
+
+class QuoteIndex:
+    """Paragraphs keyed by (book keyword, location), with a full-text index over their content."""
+    def __init__(self, filename=INDEX_FILE):
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def add(self, keyword, results):
+        """Add or update {"title", "location", "quote"} entries for one book keyword."""
+        self.connection.executemany(
+            """INSERT INTO paragraphs (keyword, abbreviation, location, title, content) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (keyword, location) DO UPDATE SET title = excluded.title, content = excluded.content
+               WHERE content IS NOT excluded.content OR title IS NOT excluded.title""",
+            [(keyword, abbreviation_map.get(keyword), entry["location"], entry["title"], entry["quote"])
+             for entry in results if entry.get("location")]
+        )
+        self.connection.commit()
+
+    def search(self, query, keywords=None, limit=None):
+        """
+        Return {"keyword", "title", "location", "quote"} for paragraphs matching query, best 
+        match first, optionally only from the given book keywords.
+        """
+        sql = """SELECT p.keyword, p.title, p.location, p.content
+                 FROM paragraphs_fts JOIN paragraphs p ON p.rowid = paragraphs_fts.rowid
+                 WHERE paragraphs_fts MATCH ?"""
+        params = [to_fts_query(query)]
+        if keywords is not None:
+            sql += f" AND p.keyword IN ({', '.join('?' * len(keywords))})"
+            params.extend(keywords)
+        sql += " ORDER BY bm25(paragraphs_fts)"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [
+            {"keyword": keyword, "title": title, "location": location, "quote": content}
+            for keyword, title, location, content in self.connection.execute(sql, params)
+        ]
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM paragraphs").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
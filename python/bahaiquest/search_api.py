@@ -11,20 +11,73 @@ To fill in the <REPLACEME> section below
  5: Look for "-H 'authorization: Basic...."
  6. You may want to change the URL endpoint also...
  
-Usage: python search_api.py <keyword>
+Usage: 
+	$ python search_api.py <keyword> (One keyword filter after another, with long pauses in between)
+	$ python search_api.py <keyword> -async (All keyword filters at once, sharing one rate limiter)
+	$ python search_api.py <keyword> -async -rate:2 (Start at 2 requests per second instead of 1)
+	$ python search_api.py <keyword> -combined (Search all keyword filters with one query, can be used with -async)
+	$ python search_api.py <keyword> -nocache (Always ask the server, don't read or write the cache)
+	$ python search_api.py <keyword> -local (Answer from the local index only, no requests at all)
+	$ python search_api.py -index-output (Add the files already in the output folder to the local index)
 
+In -async mode there are no fixed pauses. Every request takes a token from a shared bucket 
+that refills at the current rate. The rate creeps up while requests succeed and is halved 
+when the server answers 429, which also pauses everyone for the Retry-After time, so the 
+run goes as fast as the server allows and no faster.
+
+Results are paged with a point in time and search_after rather than from/size, so deep 
+pages cost the server no more than the first one. Each batch is appended to 
+output/<query>_<keyword>.txt as soon as it arrives, one JSON object per line, so memory 
+use doesn't grow with the number of hits. The file only appears once the search for 
+that keyword has finished.
+
+In -combined mode the query is scored only once: a single search filters on every keyword 
+in keyword_filter.txt at the same time, and each hit is sent to the output file of the 
+keyword(s) it carries. The output files are the same as in the other modes.
+
+Every response is saved in the cache folder under a hash of the request, so running the 
+same search again (for example after changing keyword_filter.txt) reads those pages from 
+disk with no request and no pause. Entries expire after CACHE_TTL, and the least recently 
+used ones are removed once the folder grows past CACHE_MAX_BYTES. A keyword answered 
+entirely from the cache makes no requests at all, the point in time is only opened once 
+a page has to be fetched. If a page is missing after cached pages of the same search, 
+that keyword is started again without reading the cache, since a fresh page can't safely 
+follow on from a search_after taken from an older response.
+
+Every paragraph downloaded is also added to library-index.sqlite (see quote_index.py). 
+With -local the search runs against that index instead, ranked by relevance and limited 
+to the books in keyword_filter.txt, and writes the same output files. It only knows 
+paragraphs that earlier searches have fetched.
 """
 
+import asyncio
+from collections import defaultdict
+import hashlib
 import requests
 import json
 import sys
 import time
 import random
 import os
+import re
+from process_quotes import read_quotes
+from quote_index import QuoteIndex
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from wiki_session import retry_after
 
 # API Endpoint
 url = "https://f4e3b80fb962746a74ba859b4b27e7d6.us-east-1.aws.found.io/library/_search"
 
+index_url = url.rsplit("/_search", 1)[0]
+base_url = index_url.rsplit("/", 1)[0]
+PIT_KEEP_ALIVE = "2m"
+CACHED_PIT = "cached"  # Stands in for the id when looking up pages that were fetched with a point in time
+
+CACHE_FOLDER = "cache"
+CACHE_TTL = 7 * 24 * 3600  # Seconds before a cached response is fetched again
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
 # Authorization
 headers = {
     "Authorization": "Basic <REPLACEME>",
@@ -32,79 +85,427 @@ headers = {
     "User-Agent": "Mozilla/5.0"
 }
 
-# Function to perform search with rate limiting
-def search_bahai_library(query, keyword_filter, batch_size=50, max_retries=5):
-    all_results = []
-    from_index = 0
-
-    while True:
-        payload = {
-            "query": {
-                "bool": {
-                    "must": {
-                        "query_string": {
-                            "query": query,
-                            "fields": ["content_en.en_norm^10", "content_en.en_norm_stem"],
-                            "default_operator": "AND"
-                        }
-                    },
-                    "should": {
-                        "multi_match": {
-                            "query": query,
-                            "type": "phrase",
-                            "operator": "and",
-                            "fields": ["content_en.en_norm^100", "content_en.en_norm_stem^50"]
-                        }
-                    },
-                    "filter": {
-                        "term": {"unit": "para"}
+def build_payload(query, keyword_filter, batch_size, search_after=None, pit_id=None):
+    """keyword_filter is one keyword, or a list of keywords to search all at once."""
+    combined = isinstance(keyword_filter, list)
+    payload = {
+        "query": {
+            "bool": {
+                "must": {
+                    "query_string": {
+                        "query": query,
+                        "fields": ["content_en.en_norm^10", "content_en.en_norm_stem"],
+                        "default_operator": "AND"
                     }
+                },
+                "should": {
+                    "multi_match": {
+                        "query": query,
+                        "type": "phrase",
+                        "operator": "and",
+                        "fields": ["content_en.en_norm^100", "content_en.en_norm_stem^50"]
+                    }
+                },
+                "filter": {
+                    "term": {"unit": "para"}
                 }
-            },
-            "post_filter": {
-                "bool": {
-                    "filter": [{"term": {"keywords": keyword_filter}}]
-                }
-            },
-            "sort": {"_score": "desc"},
-            "from": from_index,
-            "size": batch_size
-        }
-
-        retries = 0
-        while retries < max_retries:
-            response = requests.post(url, headers=headers, json=payload)
-
-            if response.status_code == 200:
-                results = response.json().get("hits", {}).get("hits", [])
-                if not results:
-                    return all_results  # No more results, stop fetching
-
-                for hit in results:
-                    source = hit["_source"]
-                    all_results.append({
-                        "title": source.get("title"),
-                        "location": source.get("location"),
-                        "quote": source.get("content_en")
-                    })
-
-                from_index += batch_size  # Move to the next batch
-
-                # Randomized delay (10 to 30 seconds) to prevent rate limiting
-                time.sleep(random.uniform(10, 30))
+            }
+        },
+        "post_filter": {
+            "bool": {
+                "filter": [{"terms" if combined else "term": {"keywords": keyword_filter}}]
+            }
+        },
+        # Ties on score are broken by document order, which search_after needs to page reliably
+        "sort": [{"_score": "desc"}, {"_shard_doc" if pit_id else "_doc": "asc"}],
+        # In combined mode the keywords tell us which output file each hit belongs to
+        "_source": ["title", "location", "content_en"] + (["keywords"] if combined else []),
+        "track_total_hits": False,
+        "size": batch_size
+    }
+    if search_after:
+        payload["search_after"] = search_after
+    if pit_id:
+        payload["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+    return payload
+
+def open_point_in_time(session):
+    """Return a point in time id for the index, or None if the server doesn't allow it."""
+    try:
+        response = session.post(f"{index_url}/_pit", params={"keep_alive": PIT_KEEP_ALIVE}, headers=headers)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.json().get("id")
+
+def close_point_in_time(session, pit_id):
+    if pit_id:
+        try:
+            session.delete(f"{base_url}/_pit", headers=headers, json={"id": pit_id})
+        except requests.RequestException:
+            pass  # It expires on its own after PIT_KEEP_ALIVE
+
+def post_search(session, payload):
+    # Searches against a point in time must not name the index
+    return session.post(f"{base_url}/_search" if "pit" in payload else url, headers=headers, json=payload)
+
+class ResultWriter:
+    """
+    Appends hits to a .part file as JSON lines, renamed to the final name when closed. 
+    If an index is given the hits are added to it as well.
+    """
+    def __init__(self, query, keyword, index=None):
+        self.keyword = keyword
+        self.index = index
+        self.filename = os.path.join("output", f"{query}_{keyword}.txt")
+        self.part_filename = self.filename + ".part"
+        self.file = open(self.part_filename, "w", encoding="utf-8")
+        self.count = 0
+
+    def write_batch(self, hits):
+        self.write_results([hit_to_result(hit) for hit in hits])
+
+    def write_results(self, results):
+        for result in results:
+            self.file.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.count += len(results)
+        if self.index:
+            self.index.add(self.keyword, results)
+
+    def restart(self):
+        """Throw away the results written so far, to write the search again from the start."""
+        self.file.seek(0)
+        self.file.truncate()
+        self.count = 0
+
+    def close(self, complete=True):
+        self.file.close()
+        if self.count and complete:
+            os.replace(self.part_filename, self.filename)
+            print(f"Saved {self.count} results to {self.filename}")
+        else:
+            os.remove(self.part_filename)
+
+class KeywordSplitter:
+    """Sends each hit of a combined search to the ResultWriter of every keyword it matches."""
+    def __init__(self, query, keywords, index=None):
+        self.writers = {keyword: ResultWriter(query, keyword, index) for keyword in keywords}
+
+    def write_batch(self, hits):
+        # One write per keyword per batch, so the output flush and index commit aren't paid per hit
+        by_keyword = defaultdict(list)
+        for hit in hits:
+            keywords = hit["_source"].get("keywords", [])
+            for keyword in [keywords] if isinstance(keywords, str) else keywords:
+                if keyword in self.writers:
+                    by_keyword[keyword].append(hit)
+        for keyword, keyword_hits in by_keyword.items():
+            self.writers[keyword].write_batch(keyword_hits)
+
+    def restart(self):
+        for writer in self.writers.values():
+            writer.restart()
+
+    def close(self, complete=True):
+        for writer in self.writers.values():
+            writer.close(complete)
+
+class ResponseCache:
+    """
+    Search responses on disk, one file per request named after a hash of the request. 
+    A file's modification time records when it was last used, for least recently used eviction.
+    """
+    def __init__(self, folder=CACHE_FOLDER, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.name.endswith(".json"))
+
+    def path(self, payload):
+        # The point in time id changes every run, so only whether one was used goes in the key
+        key = {k: v for k, v in payload.items() if k != "pit"}
+        if "search_after" in key:
+            key["pit"] = "pit" in payload
+        else:
+            # The first page is found whether or not a point in time opens, and its response 
+            # (with or without a pit_id) tells which way the following pages were fetched
+            del key["sort"]
+        digest = hashlib.sha256(json.dumps([index_url, key], sort_keys=True).encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, f"{digest}.json")
+
+    def get(self, payload):
+        path = self.path(payload)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        if time.time() - entry["created"] > self.ttl:
+            self.misses += 1
+            return None
+        os.utime(path)  # Mark as recently used
+        self.hits += 1
+        return entry["response"]
+
+    def put(self, payload, response):
+        path = self.path(payload)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "response": response}, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        self.size += os.path.getsize(path) - old_size
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the folder is back under 90% of max_bytes."""
+        entries = sorted(
+            (entry for entry in os.scandir(self.folder) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self.size <= self.max_bytes * 0.9:
                 break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
+
+def hit_to_result(hit):
+    source = hit["_source"]
+    return {
+        "title": source.get("title"),
+        "location": source.get("location"),
+        "quote": source.get("content_en")
+    }
+
+def fetch_page(session, payload, keyword_filter, max_retries):
+    """POST one search, backing off on 429. Returns the response JSON or None on failure."""
+    for retries in range(max_retries):
+        try:
+            response = post_search(session, payload)
+        except requests.RequestException as e:
+            print(f"Request failed for keyword '{keyword_filter}': {e}")
+            return None
+
+        if response.status_code == 200:
+            return response.json()
 
-            elif response.status_code == 429:
-                # Too many requests - exponential backoff
-                wait_time = (2 ** retries) + random.uniform(0, 1)
-                print(f"Rate limit hit. Retrying in {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-                retries += 1
+        elif response.status_code == 429:
+            # Too many requests - exponential backoff
+            wait_time = (2 ** retries) + random.uniform(0, 1)
+            print(f"Rate limit hit. Retrying in {wait_time:.2f} seconds...")
+            time.sleep(wait_time)
+        else:
+            print(f"Error {response.status_code} for keyword '{keyword_filter}': {response.text}")
+            return None
+
+    print(f"Giving up on keyword '{keyword_filter}' after {max_retries} rate limited attempts.")
+    return None
+
+def replay_cache(cache, query, keyword_filter, batch_size, writer):
+    """
+    Write a search from cached pages alone, returning True if every page up to the last was 
+    cached. Otherwise anything written is thrown away and the search has to run from the start.
+    """
+    search_after = None
+    pit_mode = False
+    pages = 0
+    while True:
+        payload = build_payload(query, keyword_filter, batch_size, search_after, CACHED_PIT if pit_mode else None)
+        data = cache.get(payload)
+        if data is None:
+            if pages:
+                print(f"Page {pages + 1} of '{keyword_filter}' is not cached, starting it again without the cache")
+                writer.restart()
+            return False
+        if search_after is None:
+            pit_mode = "pit_id" in data
+        results = data.get("hits", {}).get("hits", [])
+        if not results:
+            return True
+        writer.write_batch(results)
+        search_after = results[-1]["sort"]
+        pages += 1
+
+# Function to perform search with rate limiting
+def search_bahai_library(query, keyword_filter, writer, batch_size=50, max_retries=5, cache=None):
+    """Page through all hits for one keyword filter, handing each batch to writer."""
+    if cache and replay_cache(cache, query, keyword_filter, batch_size, writer):
+        return
+    session = requests.Session()
+    pit_id = open_point_in_time(session)
+    search_after = None
+
+    try:
+        while True:
+            payload = build_payload(query, keyword_filter, batch_size, search_after, pit_id)
+
+            data = fetch_page(session, payload, keyword_filter, max_retries)
+            if data is None:
+                return
+            if cache:
+                cache.put(payload, data)
+            pit_id = data.get("pit_id", pit_id)
+
+            results = data.get("hits", {}).get("hits", [])
+            if not results:
+                return  # No more results, stop fetching
+
+            writer.write_batch(results)
+            search_after = results[-1]["sort"]  # Move to the next batch
+
+            # Randomized delay (10 to 30 seconds) to prevent rate limiting
+            time.sleep(random.uniform(10, 30))
+    finally:
+        close_point_in_time(session, pit_id)
+
+class TokenBucket:
+    """
+    Rate limiter shared by every concurrent search. The rate grows a little after each 
+    successful request and is halved on a 429, so it settles just under the real limit.
+    """
+    def __init__(self, rate=1.0, max_rate=5.0, min_rate=0.05, capacity=1):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        # Holding the lock while sleeping makes waiting requests line up in order
+        async with self.lock:
+            while True:
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def succeeded(self):
+        self.rate = min(self.max_rate, self.rate + 0.1 * self.rate)
+
+    def throttled(self, wait_time):
+        # Several requests can be rejected in the same burst, only slow down once per pause
+        if time.monotonic() >= self.paused_until:
+            self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0
+        self.paused_until = max(self.paused_until, time.monotonic() + wait_time)
+
+async def search_bahai_library_async(query, keyword_filter, limiter, session, writer, batch_size=50, max_retries=5,
+                                     cache=None):
+    """Same search as search_bahai_library, paced by the shared limiter instead of fixed sleeps."""
+    # Cached pages don't touch the server, so they don't take a token either
+    if cache and replay_cache(cache, query, keyword_filter, batch_size, writer):
+        return
+    # requests is blocking, so run it in a worker thread to keep the other searches going
+    pit_id = await asyncio.to_thread(open_point_in_time, session)
+    search_after = None
+
+    try:
+        while True:
+            payload = build_payload(query, keyword_filter, batch_size, search_after, pit_id)
+
+            for retries in range(max_retries):
+                await limiter.acquire()
+                try:
+                    response = await asyncio.to_thread(post_search, session, payload)
+                except requests.RequestException as e:
+                    print(f"Request failed for keyword '{keyword_filter}': {e}")
+                    return
+
+                if response.status_code == 200:
+                    limiter.succeeded()
+                    data = response.json()
+                    if cache:
+                        cache.put(payload, data)
+                    results = data.get("hits", {}).get("hits", [])
+                    if not results:
+                        return  # No more results, stop fetching
+                    writer.write_batch(results)
+                    search_after = results[-1]["sort"]  # Move to the next batch
+                    pit_id = data.get("pit_id", pit_id)
+                    break
+
+                elif response.status_code == 429:
+                    wait_time = retry_after(response, (2 ** retries) + random.uniform(0, 1))
+                    limiter.throttled(wait_time)
+                    print(f"Rate limit hit for '{keyword_filter}'. Pausing {wait_time:.2f} seconds, "
+                          f"then {limiter.rate:.2f} requests/second...")
+                else:
+                    print(f"Error {response.status_code} for keyword '{keyword_filter}': {response.text}")
+                    return
             else:
-                print(f"Error {response.status_code} for keyword '{keyword_filter}': {response.text}")
-                return all_results
+                print(f"Giving up on keyword '{keyword_filter}' after {max_retries} rate limited attempts.")
+                return
+    finally:
+        await asyncio.to_thread(close_point_in_time, session, pit_id)
+
+async def search_all_keywords(query, keyword_filters, rate=1.0, combined=False, cache=None, index=None):
+    """Run every keyword filter at the same time through one shared TokenBucket."""
+    limiter = TokenBucket(rate=rate, max_rate=max(rate, 5.0))
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=len(keyword_filters)))
+
+    async def search_and_save(keyword_filter, writer):
+        try:
+            await search_bahai_library_async(query, keyword_filter, limiter, session, writer, cache=cache)
+        except BaseException:
+            writer.close(complete=False)
+            raise
+        writer.close()
 
-    return all_results
+    start = time.monotonic()
+    if combined:
+        await search_and_save(keyword_filters, KeywordSplitter(query, keyword_filters, index))
+    else:
+        await asyncio.gather(*(
+            search_and_save(keyword, ResultWriter(query, keyword, index)) for keyword in keyword_filters
+        ))
+    print(f"Searched {len(keyword_filters)} keyword filters in {time.monotonic() - start:.1f} seconds "
+          f"(final rate {limiter.rate:.2f} requests/second).")
+
+def search_local(query, keyword_filters, index):
+    """Answer the search from the local index and write the usual output files."""
+    start = time.perf_counter()
+    by_keyword = defaultdict(list)
+    for result in index.search(query, keyword_filters):
+        by_keyword[result.pop("keyword")].append(result)
+
+    for keyword in keyword_filters:
+        writer = ResultWriter(query, keyword)
+        writer.write_results(by_keyword[keyword])
+        writer.close()
+    print(f"Found {sum(map(len, by_keyword.values()))} paragraphs in {len(by_keyword)} books "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms ({index.count()} paragraphs indexed).")
+
+def index_output_folder(index, folder="output"):
+    """Add every <query>_<keyword>.txt file in the output folder to the index."""
+    for filename in sorted(os.listdir(folder)):
+        match = re.match(r"[^_]+_(.+)\.txt$", filename)
+        if not match:
+            continue
+        quotes = read_quotes(os.path.join(folder, filename))
+        if quotes:
+            index.add(match.group(1), quotes)
+            print(f"Indexed {len(quotes)} paragraphs from {filename}")
+    print(f"{index.count()} paragraphs in the index.")
 
 # Read keyword filters from file
 def load_keyword_filters(filename="keyword_filter.txt"):
@@ -121,17 +522,49 @@ if __name__ == "__main__":
         print("Usage: python search_api.py <query>")
         sys.exit(1)
 
+    index = QuoteIndex()
+    if sys.argv[1] == "-index-output":
+        index_output_folder(index)
+        sys.exit(0)
+
     query = sys.argv[1]
     keyword_filters = load_keyword_filters()
 
-    for keyword in keyword_filters:
-        results = search_bahai_library(query, keyword)
+    if "-local" in sys.argv[2:]:
+        search_local(query, keyword_filters, index)
+        sys.exit(0)
+
+    combined = "-combined" in sys.argv[2:]
+    cache = None if "-nocache" in sys.argv[2:] else ResponseCache()
+
+    if "-async" in sys.argv[2:]:
+        rate = 1.0
+        for arg in sys.argv[2:]:
+            if arg.startswith("-rate:"):
+                rate = float(arg.split(":", 1)[1])
+        asyncio.run(search_all_keywords(query, keyword_filters, rate, combined, cache, index))
+    elif combined:
+        splitter = KeywordSplitter(query, keyword_filters, index)
+        try:
+            search_bahai_library(query, keyword_filters, splitter, cache=cache)
+        except BaseException:
+            splitter.close(complete=False)
+            raise
+        splitter.close()
+    else:
+        for keyword in keyword_filters:
+            misses = cache.misses if cache else 0
+            writer = ResultWriter(query, keyword, index)
+            try:
+                search_bahai_library(query, keyword, writer, cache=cache)
+            except BaseException:
+                writer.close(complete=False)
+                raise
+            writer.close()
 
-        if results:
-            filename = os.path.join('output', f"{query}_{keyword}.txt")
-            with open(filename, "w", encoding="utf-8") as f:
-                json.dump(results, f, indent=2, ensure_ascii=False)
-            print(f"Saved results to {filename}")
+            # Additional delay between keyword requests (to prevent excessive API calls)
+            if cache is None or cache.misses > misses:
+                time.sleep(random.uniform(15, 20))
 
-        # Additional delay between keyword requests (to prevent excessive API calls)
-        time.sleep(random.uniform(15, 20))
+    if cache:
+        print(f"Cache: {cache.hits} page(s) read from disk, {cache.misses} fetched.")
@@ -0,0 +1,146 @@
+r"""
+Run after search_api.py and before process_quotes.py. For every quote in the output folder 
+this picks the sentence that best matches the search and stores it as "quote_short", so 
+instead of cutting each paragraph down by hand you only need to check the suggestion.
+
+process_quotes.py uses "quote_short" when it is present and not empty, otherwise the full 
+"quote". To override a suggestion edit "quote_short"; to use the whole paragraph set it 
+to "". Suggestions already in a file are left alone unless -force is given, so your 
+changes survive a rerun.
+
+The search words are taken from the file name (<query>_<keyword>.txt). Sentences are 
+scored by how many of those words they contain, rarer words counting for more, with a 
+bonus for the exact phrase and a penalty for very short or very long sentences. 
+Everything runs locally.
+
+Usage: 
+	$ python shorten_quotes.py (Every file in the output folder)
+	$ python shorten_quotes.py faith (Only files for the search "faith")
+	$ python shorten_quotes.py -force (Replace existing suggestions too)
+"""
+
+import json
+import math
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter
+from process_quotes import read_quotes
+
+OUTPUT_FOLDER = "output"
+QUERY_OPERATORS = {"and", "or", "not"}
+IDEAL_WORDS = (8, 40)  # Sentences outside this length are scored lower
+
+# Words ending in a period that don't end a sentence
+ABBREVIATIONS = {"mr", "mrs", "dr", "st", "vol", "p", "pp", "cf", "e.g", "i.e", "ibid", "no", "viz"}
+
+
+def split_sentences(text):
+    """
+    Split a paragraph at ., ! and ? followed by a space, unless the period ends an 
+    abbreviation or the next word starts in lower case.
+    """
+    sentences, start = [], 0
+    for match in re.finditer(r"[.!?][’”\"')\]]*\s+", text):
+        before = text[start:match.start()].split()
+        last_word = before[-1].lower().rstrip(".") if before else ""
+        if match.group().startswith(".") and (last_word in ABBREVIATIONS or len(last_word) == 1):
+            continue
+        if text[match.end():match.end() + 1].islower():
+            continue  # e.g. “Is it so?” he asked.
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    return sentences
+
+
+def normalize_words(text):
+    """Lowercase words without diacritics and with common English endings removed."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    words = []
+    for word in re.findall(r"\w+", text):
+        for suffix in ("ing", "edly", "ed", "ly", "es", "s"):
+            if len(word) > len(suffix) + 2 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        words.append(word)
+    return words
+
+
+def query_terms(query):
+    return [word for word in normalize_words(query) if word not in QUERY_OPERATORS]
+
+
+def best_sentence(quote, terms, phrase, idf):
+    """Return the sentence of quote that scores highest for the search terms."""
+    sentences = split_sentences(quote)
+    if len(sentences) <= 1:
+        return quote.strip()
+
+    def score(sentence):
+        words = normalize_words(sentence)
+        present = set(words)
+        value = sum(idf.get(term, 1.0) for term in set(terms) if term in present)
+        if phrase and phrase in " ".join(words):
+            value += 2.0
+        if len(words) < IDEAL_WORDS[0]:
+            value *= len(words) / IDEAL_WORDS[0]
+        elif len(words) > IDEAL_WORDS[1]:
+            value *= IDEAL_WORDS[1] / len(words)
+        return value
+
+    # max() keeps the first of equally good sentences
+    return max(sentences, key=score)
+
+
+def shorten_file(path, query, force=False):
+    """Add quote_short to the quotes of one file. Returns how many suggestions were added."""
+    quotes = read_quotes(path)
+    if not quotes:
+        return 0
+
+    terms = query_terms(query)
+    phrase = " ".join(terms) if len(terms) > 1 else ""
+
+    # Rarer search words say more about a sentence, weight them by inverse sentence frequency
+    sentence_words = [set(normalize_words(s)) for entry in quotes for s in split_sentences(entry["quote"])]
+    counts = Counter(term for words in sentence_words for term in set(terms) if term in words)
+    idf = {term: math.log(1 + len(sentence_words) / (1 + counts[term])) for term in terms}
+
+    added = 0
+    for entry in quotes:
+        if "quote_short" in entry and not force:
+            continue
+        entry["quote_short"] = best_sentence(entry["quote"], terms, phrase, idf)
+        added += 1
+
+    if added:
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry in quotes:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temp_path, path)
+    return added
+
+
+def main(args):
+    force = "-force" in args
+    only_query = next((arg for arg in args if not arg.startswith("-")), None)
+
+    total = 0
+    for filename in sorted(os.listdir(OUTPUT_FOLDER)):
+        match = re.match(r"([^_]+)_(.+)\.txt$", filename)
+        if not match or (only_query and match.group(1) != only_query):
+            continue
+        added = shorten_file(os.path.join(OUTPUT_FOLDER, filename), match.group(1), force)
+        if added:
+            print(f"Suggested {added} short quotes in {filename}")
+        total += added
+    print(f"Done, {total} suggestion(s) added.")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,262 @@
+r"""
+A small local stand-in for the MediaWiki api, used to try out and benchmark the 
+scripts in this folder without touching bahai.works or bahaidata.org.
+
+Pages are kept in memory and lost when the server stops.
+
+Usage: 
+	$ python mock_api.py (Serves http://localhost:8080/api.php)
+	$ python mock_api.py -port:9000 -latency:0.2 (Waits 0.2 seconds before answering each request)
+	$ python mock_api.py -maxlag-every:20 (Every 20th edit fails with a maxlag error)
+	$ python mock_api.py -token-lifetime:30 (CSRF tokens stop working 30 seconds after login)
+	$ python mock_api.py -max-upload:1000000 (Refuse uploads of more than 1000000 bytes sent in one piece)
+
+Then point a script at it, for example: python api_addpages_works.py -api:http://localhost:8080/api.php -workers:8
+
+File uploads (plain and chunked, as used by BWNS/upload.py) are accepted too, and 
+list=allimages answers aisha1 lookups for the files uploaded so far.
+"""
+
+import email.parser
+import email.policy
+import hashlib
+import json
+import secrets
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+pages = {}
+sitelinks = {}  # item id -> {site id: page title}
+files = {}  # file name -> {'sha1': ..., 'size': ..., 'text': ...}
+stash = {}  # filekey -> bytes received so far of a chunked upload
+lock = threading.Lock()
+tokens = {}  # CSRF token -> time it was handed out
+settings = {'latency': 0.0, 'maxlag_every': 0, 'token_lifetime': 0, 'max_upload': 0}
+counters = {'requests': 0, 'edits': 0, 'logins': 0, 'uploads': 0, 'upload_bytes': 0}
+
+def token_error(params):
+    """Return a badtoken error for a missing, unknown or expired CSRF token, else None."""
+    with lock:
+        issued = tokens.get(params.get('token'))
+    if issued is None or (settings['token_lifetime'] and time.time() - issued > settings['token_lifetime']):
+        return {'error': {'code': 'badtoken', 'info': 'Invalid CSRF token.'}}
+    return None
+
+def handle_query(params):
+    if params.get('meta') == 'tokens':
+        if params.get('type') == 'login':
+            return {'query': {'tokens': {'logintoken': 'mock-login-token+\\'}}}
+        token = secrets.token_hex(8) + '+\\'
+        with lock:
+            tokens[token] = time.time()
+        return {'query': {'tokens': {'csrftoken': token}}}
+    if params.get('prop') == 'revisions' and 'titles' in params:
+        return query_revisions(params['titles'].split('|'))
+    if params.get('list') == 'allimages' and 'aisha1' in params:
+        with lock:
+            found = [{'name': name, 'title': f"File:{name}"} for name, info in files.items() if info['sha1'] == params['aisha1']]
+        return {'batchcomplete': True, 'query': {'allimages': found}}
+    return {'batchcomplete': ''}
+
+def query_revisions(titles):
+    results = []
+    with lock:
+        for title in titles:
+            if title in pages:
+                sha1 = hashlib.sha1(pages[title].encode('utf-8')).hexdigest()
+                results.append({'title': title, 'revisions': [{'slots': {'main': {'sha1': sha1}}}]})
+            else:
+                results.append({'title': title, 'missing': True})
+    return {'batchcomplete': True, 'query': {'pages': results}}
+
+def handle_login(params):
+    with lock:
+        counters['logins'] += 1
+    return {'login': {'result': 'Success', 'lgusername': params.get('lgname')}}
+
+def handle_edit(params):
+    error = token_error(params)
+    if error:
+        return error
+    with lock:
+        counters['edits'] += 1
+        if settings['maxlag_every'] and counters['edits'] % settings['maxlag_every'] == 0:
+            return {'error': {'code': 'maxlag', 'info': 'Waiting for a database server: 6 seconds lagged.'}}
+        title = params.get('title')
+        new = title not in pages
+        pages[title] = params.get('text', '').rstrip()  # Like MediaWiki, drop trailing whitespace
+    result = {'result': 'Success', 'title': title}
+    if new:
+        result['new'] = ''
+    return {'edit': result}
+
+def file_name(filename):
+    name = filename.replace('_', ' ').strip()
+    return name[:1].upper() + name[1:]
+
+def store_file(params, content):
+    """Create a file page from a finished upload, with MediaWiki's exists and duplicate warnings."""
+    name = file_name(params.get('filename', ''))
+    sha1 = hashlib.sha1(content).hexdigest()
+    with lock:
+        warnings = {}
+        if name in files and not params.get('ignorewarnings'):
+            warnings['exists'] = name.replace(' ', '_')
+        duplicates = [other.replace(' ', '_') for other, info in files.items() if info['sha1'] == sha1 and other != name]
+        if duplicates and not params.get('ignorewarnings'):
+            warnings['duplicate'] = duplicates
+        if warnings:
+            key = secrets.token_hex(6)
+            stash[key] = content
+            return {'upload': {'result': 'Warning', 'warnings': warnings, 'filekey': key}}
+        files[name] = {'sha1': sha1, 'size': len(content), 'text': params.get('text', '')}
+        counters['uploads'] += 1
+    return {'upload': {'result': 'Success', 'filename': name.replace(' ', '_'),
+                       'imageinfo': {'sha1': sha1, 'size': len(content)}}}
+
+def handle_upload(params):
+    error = token_error(params)
+    if error:
+        return error
+    upload = params.get('_files', {})
+    if 'chunk' in upload:
+        chunk = upload['chunk']
+        offset, filesize = int(params.get('offset', 0)), int(params.get('filesize', 0))
+        with lock:
+            counters['upload_bytes'] += len(chunk)
+            key = params.get('filekey') or secrets.token_hex(6)
+            received = stash.get(key, b'')
+            if offset != len(received):
+                return {'error': {'code': 'stashfailed', 'info': f'Expected offset {len(received)}, got {offset}.'}}
+            stash[key] = received + chunk
+            if len(stash[key]) < filesize:
+                return {'upload': {'result': 'Continue', 'offset': len(stash[key]), 'filekey': key}}
+        return {'upload': {'result': 'Success', 'filekey': key}}
+    if 'file' in upload:
+        content = upload['file']
+        with lock:
+            counters['upload_bytes'] += len(content)
+        if settings['max_upload'] and len(content) > settings['max_upload']:
+            return {'error': {'code': 'file-too-large', 'info': 'The file you submitted was too large.'}}
+        return store_file(params, content)
+    if 'filekey' in params:
+        with lock:
+            content = stash.pop(params['filekey'], None)
+        if content is None:
+            return {'error': {'code': 'missingresult', 'info': 'No stashed file with that key.'}}
+        return store_file(params, content)
+    return {'error': {'code': 'missingparam', 'info': 'One of the parameters "filekey", "file" and "url" is required.'}}
+
+def handle_wbsetsitelink(params):
+    error = token_error(params)
+    if error:
+        return error
+    with lock:
+        counters['edits'] += 1
+        sitelinks.setdefault(params['id'], {})[params['linksite']] = params['linktitle']
+    return {'entity': {'id': params['id'], 'sitelinks': {params['linksite']: {
+        'site': params['linksite'], 'title': params['linktitle']}}}, 'success': 1}
+
+def handle_wbgetentities(params):
+    site = params.get('sitefilter')
+    entities = {}
+    with lock:
+        for item_id in params.get('ids', '').split('|'):
+            # Pretend every Q-number up to 100000 exists
+            if not item_id.startswith('Q') or not item_id[1:].isdigit() or int(item_id[1:]) > 100000:
+                entities[item_id] = {'id': item_id, 'missing': ''}
+                continue
+            links = sitelinks.get(item_id, {})
+            if site:
+                links = {key: value for key, value in links.items() if key == site}
+            entities[item_id] = {'type': 'item', 'id': item_id, 'sitelinks': {
+                key: {'site': key, 'title': title, 'badges': []} for key, title in links.items()}}
+    return {'entities': entities, 'success': 1}
+
+handlers = {
+    'query': handle_query,
+    'login': handle_login,
+    'edit': handle_edit,
+    'upload': handle_upload,
+    'wbsetsitelink': handle_wbsetsitelink,
+    'wbgetentities': handle_wbgetentities,
+}
+
+def parse_multipart(body, content_type):
+    """Split a multipart/form-data body into text fields, with uploaded files under '_files'."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode('utf-8') + body)
+    params = {'_files': {}}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        content = part.get_payload(decode=True)
+        if part.get_filename() is not None:
+            params['_files'][name] = content
+        else:
+            params[name] = content.decode('utf-8')
+    return params
+
+class ApiHandler(BaseHTTPRequestHandler):
+    def respond(self, params):
+        with lock:
+            counters['requests'] += 1
+        if settings['latency']:
+            time.sleep(settings['latency'])
+
+        handler = handlers.get(params.get('action'))
+        if handler:
+            result = handler(params)
+        else:
+            result = {'error': {'code': 'badvalue', 'info': f"Unrecognized value for parameter \"action\": {params.get('action')}."}}
+
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        if result.get('error', {}).get('code') == 'maxlag':
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        self.respond({key: values[-1] for key, values in query.items()})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            self.respond(parse_multipart(body, content_type))
+            return
+        form = parse_qs(body.decode('utf-8'))
+        self.respond({key: values[-1] for key, values in form.items()})
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet, the summary on exit is enough
+
+if __name__ == "__main__":
+    port = 8080
+    for arg in sys.argv[1:]:
+        if arg.startswith('-port:'):
+            port = int(arg.split(':', 1)[1])
+        elif arg.startswith('-latency:'):
+            settings['latency'] = float(arg.split(':', 1)[1])
+        elif arg.startswith('-maxlag-every:'):
+            settings['maxlag_every'] = int(arg.split(':', 1)[1])
+        elif arg.startswith('-token-lifetime:'):
+            settings['token_lifetime'] = float(arg.split(':', 1)[1])
+        elif arg.startswith('-max-upload:'):
+            settings['max_upload'] = int(arg.split(':', 1)[1])
+
+    server = ThreadingHTTPServer(('localhost', port), ApiHandler)
+    print(f"Serving mock api on http://localhost:{port}/api.php (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f"Handled {counters['requests']} requests, {counters['logins']} logins, {counters['edits']} edits, {len(pages)} pages stored.")
+    print(f"Received {counters['upload_bytes']} upload bytes, stored {counters['uploads']} files.")
@@ -5,22 +5,50 @@ Usage:
 	$ python pages-from-cat.py (Saves a formatted list of authors A-Z to pages-from-cat-output.txt)
 	$ python pages-from-cat.py H (Only saves authors in Category:Authors-H)
 	$ python pages-from-cat.py -type:plain (only outputs a list of category members, no formatting)
+	$ python pages-from-cat.py -workers:26 (Fetch all letters at once, default is 6 at a time)
+	$ python pages-from-cat.py -refresh (Ignore the cache and download every category again)
+	$ python pages-from-cat.py -publish (Also save the changed letters straight to [[Authors]])
 
 Used with: pages-from-cat-exclusion-list.txt. This is a list of author pages to exclude 
 from pages-from-cat-output.txt
+
+Category members are kept in pages-from-cat-cache.json. On the next run only the changes 
+since the last run are downloaded: new members are found by asking for members added 
+after that time, and letters whose category had pages removed (seen in recentchanges) 
+are downloaded again in full. The output is then rebuilt from the cache.
+
+With -publish the current [[Authors]] page is split at its ==== X ==== headers and each 
+letter is compared with the newly generated one. Changed letters are saved in a single 
+edit, and nothing is saved when every letter is already up to date. Text before the first 
+header and after the last list is left as it is. Be sure to replace your username and 
+password below.
 """
 
+import json
+import os
+import re
 import requests
 import sys
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from wiki_session import WikiSession
+
+username = 'David'
+password = 'replaceme'
+
+LETTERS = [chr(code) for code in range(ord('A'), ord('Z') + 1)]
+CACHE_FILE = 'pages-from-cat-cache.json'
+RC_MAX_AGE = timedelta(days=30)  # Recent changes older than this may already be purged from the wiki
+CLOCK_MARGIN = timedelta(minutes=5)  # Overlap between runs in case our clock and the server's differ
 
 # Function to load exclusion list from a file
 def load_exclusion_list(file_name):
     try:
         with open(file_name, 'r', encoding='utf-8') as file:
-            return [line.strip() for line in file.readlines() if line.strip()]
+            return {line.strip() for line in file if line.strip()}
     except FileNotFoundError:
         print(f"Warning: '{file_name}' not found. No exclusions will be applied.")
-        return []
+        return set()
 
 # Load exclusion list from 'pages-from-cat-exclusion-list.txt'
 exclusion_list = load_exclusion_list('pages-from-cat-exclusion-list.txt')
@@ -62,20 +90,33 @@ def process_name(page_title):
     else:
         return last_part
 
-def get_category_members(category, endpoint):
+def make_session(workers):
+    """A keep-alive session with enough pooled connections for every worker."""
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+    return session
+
+def get_category_members(category, endpoint, session=requests, **extra_params):
+    """Return a list of {'title', 'sortkey', 'timestamp'} for the members of a category."""
     params = {
         'action': 'query',
         'list': 'categorymembers',
         'cmtitle': f'Category:{category}',
+        'cmprop': 'title|sortkey|timestamp',
         'format': 'json',
-        'cmlimit': 'max'
+        'cmlimit': 'max',
+        **extra_params
     }
 
     pages = []
     while True:
-        response = requests.get(endpoint, params=params)
+        response = session.get(endpoint, params=params)
         data = response.json()
-        pages.extend([page['title'] for page in data['query']['categorymembers']])
+        pages.extend([
+            {'title': page['title'], 'sortkey': page['sortkey'], 'timestamp': page['timestamp']}
+            for page in data['query']['categorymembers']
+        ])
         
         if 'continue' not in data:
             break
@@ -84,44 +125,234 @@ def get_category_members(category, endpoint):
 
     return pages
 
-def collect_authors_category(letter, endpoint, output_file, output_type):
+def get_changed_letters(endpoint, session, since):
+    """Letters whose category had members added or removed since `since`, according to recentchanges."""
+    params = {
+        'action': 'query',
+        'list': 'recentchanges',
+        'rctype': 'categorize',
+        'rcnamespace': 14,
+        'rcend': since,
+        'rcprop': 'title',
+        'rclimit': 'max',
+        'format': 'json'
+    }
+
+    letters = set()
+    while True:
+        data = session.get(endpoint, params=params).json()
+        if 'error' in data:
+            print(f"Warning: recentchanges unavailable ({data['error'].get('code')}), downloading every letter.")
+            return set(LETTERS)
+        for change in data['query']['recentchanges']:
+            name = change['title'].split(':', 1)[-1]
+            if name.startswith('Authors-') and name[len('Authors-'):] in LETTERS:
+                letters.add(name[len('Authors-'):])
+
+        if 'continue' not in data:
+            break
+
+        params['rccontinue'] = data['continue']['rccontinue']
+
+    return letters
+
+def load_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {'last_run': None, 'letters': {}}
+
+def save_cache(cache, cache_file):
+    temp_file = cache_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8') as file:
+        json.dump(cache, file, ensure_ascii=False)
+    os.replace(temp_file, cache_file)
+
+def refresh_letter(letter, endpoint, session, cache, since, changed_letters):
+    """Bring the cached members of one letter up to date, downloading as little as possible."""
     category = f'Authors-{letter}'
-    members = get_category_members(category, endpoint)
-
-    with open(output_file, 'a', encoding='utf-8') as file:  # Append mode
-        if members:  # Check if the category is not empty
-            if output_type != 'plain':
-                file.write(f"==== {letter} ====\n")  # Header for formatted type
-
-            for member in members:
-                if member not in exclusion_list:
-                    if output_type == 'plain':
-                        file.write(member + '\n')
-                    else:
-                        processed_name = process_name(member.split(":", 1)[-1])
-                        file.write(f"* [[{member}|{processed_name}]]\n")
-            
-            if output_type != 'plain':
-                file.write('\n\n')  # Two line breaks for formatted type
+    if since is None or letter not in cache['letters'] or letter in changed_letters:
+        members = get_category_members(category, endpoint, session)
+        cache['letters'][letter] = {member['title']: member for member in members}
+        print(f"Fetched category '{category}' ({len(members)} members).")
+        return
+
+    added = get_category_members(category, endpoint, session,
+                                 cmsort='timestamp', cmdir='newer', cmstart=since)
+    for member in added:
+        cache['letters'][letter][member['title']] = member
+    if added:
+        print(f"Updated category '{category}' ({len(added)} new members).")
 
+def refresh_cache(letters, endpoint, session, cache_file, workers=1, refresh=False):
+    """Refresh the cache for the given letters and return it."""
+    cache = load_cache(cache_file)
+    now = datetime.now(timezone.utc)
+    since = cache['last_run']
+    if refresh or (since and now - datetime.fromisoformat(since.replace('Z', '+00:00')) > RC_MAX_AGE):
+        since = None
+    changed_letters = get_changed_letters(endpoint, session, since) if since else set(LETTERS)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(
+            lambda letter: refresh_letter(letter, endpoint, session, cache, since, changed_letters),
+            letters
+        ))
+
+    # last_run applies to every letter, so only move it forward once all of them are current
+    if len(letters) == len(LETTERS):
+        cache['last_run'] = (now - CLOCK_MARGIN).strftime('%Y-%m-%dT%H:%M:%SZ')
+    save_cache(cache, cache_file)
+    return cache
+
+def cached_members(cache, letter):
+    """Member titles of a letter in category order (the binary sortkey, then title)."""
+    members = cache['letters'].get(letter, {}).values()
+    return [member['title'] for member in sorted(members, key=lambda member: (member['sortkey'], member['title']))]
+
+def format_authors_category(letter, members, output_type):
+    """Return the text for one letter, or an empty string if the category is empty."""
+    lines = []
+    if members:  # Check if the category is not empty
+        if output_type != 'plain':
+            lines.append(f"==== {letter} ====\n")  # Header for formatted type
+
+        for member in members:
+            if member not in exclusion_list:
+                if output_type == 'plain':
+                    lines.append(member + '\n')
+                else:
+                    processed_name = process_name(member.split(":", 1)[-1])
+                    lines.append(f"* [[{member}|{processed_name}]]\n")
+
+        if output_type != 'plain':
+            lines.append('\n\n')  # Two line breaks for formatted type
+    return ''.join(lines)
+
+def collect_authors_category(letter, endpoint, output_type, session=requests, refresh=False):
+    category = f'Authors-{letter}'
+    cache = refresh_cache([letter], endpoint, session, CACHE_FILE, refresh=refresh)
     print(f"Processed category '{category}'.")
+    return {letter: format_authors_category(letter, cached_members(cache, letter), output_type)}
+
+def collect_all_authors_categories(endpoint, output_type, workers=6, refresh=False):
+    """Refresh all letters with up to `workers` requests at once, then return their text A to Z."""
+    session = make_session(workers)
+    cache = refresh_cache(LETTERS, endpoint, session, CACHE_FILE, workers, refresh)
+    return {letter: format_authors_category(letter, cached_members(cache, letter), output_type) for letter in LETTERS}
+
+def split_sections(text):
+    """
+    Split page text into (text before the first letter, [(letter, section, tail), ...]).
+    A section is the header plus the list below it; anything after the list that isn't 
+    a list item or blank line is kept as the tail.
+    """
+    parts = re.split(r'^==== ([A-Z]) ====[ \t]*$\n?', text, flags=re.MULTILINE)
+    preamble, sections = parts[0], []
+    for letter, body in zip(parts[1::2], parts[2::2]):
+        lines = body.splitlines(keepends=True)
+        end = len(lines)
+        while end and not lines[end - 1].startswith('*'):
+            end -= 1
+        # Keep the blank lines that follow the list with the section, as generated text does
+        while end < len(lines) and not lines[end].strip():
+            end += 1
+        section = f"==== {letter} ====\n" + ''.join(lines[:end])
+        sections.append((letter, section, ''.join(lines[end:])))
+    return preamble, sections
 
-def collect_all_authors_categories(endpoint, output_file, output_type):
-    for letter in map(chr, range(ord('A'), ord('Z') + 1)):
-        collect_authors_category(letter, endpoint, output_file, output_type)
+def merge_sections(page_text, generated):
+    """Return (new page text, letters that changed) after swapping in the generated sections."""
+    preamble, sections = split_sections(page_text)
+    merged, changed = {}, []
+    for letter, section, tail in sections:
+        new_section = generated.get(letter, section)
+        if new_section.strip() != section.strip():
+            changed.append(letter)
+        merged[letter] = (new_section, tail)
+    for letter, new_section in generated.items():
+        if letter not in merged and new_section:
+            changed.append(letter)
+            merged[letter] = (new_section, '')
+
+    body = ''.join(section + tail for letter, (section, tail) in sorted(merged.items()))
+    return preamble + body, sorted(changed)
+
+def publish(wiki, page_title, generated):
+    """Save the generated letters to page_title in one edit, only if any of them changed."""
+    data = wiki.get({
+        'action': 'query',
+        'prop': 'revisions',
+        'titles': page_title,
+        'rvprop': 'content|timestamp',
+        'rvslots': 'main',
+        'curtimestamp': 1,
+        'formatversion': 2,
+        'format': 'json'
+    }).json()
+    page = data['query']['pages'][0]
+    if page.get('missing'):
+        print(f"Error: [[{page_title}]] does not exist, not publishing.")
+        return
+    revision = page['revisions'][0]
+
+    new_text, changed = merge_sections(revision['slots']['main']['content'], generated)
+    if not changed:
+        print(f"[[{page_title}]] is already up to date, nothing saved.")
+        return
+
+    response = wiki.post({
+        'action': 'edit',
+        'title': page_title,
+        'text': new_text,
+        'summary': f"Update authors: {', '.join(changed)}",
+        'basetimestamp': revision['timestamp'],  # Fail instead of overwriting someone else's edit
+        'starttimestamp': data['curtimestamp'],
+        'nocreate': 1,
+        'bot': 1,
+        'format': 'json'
+    }).json()
+    if 'error' in response:
+        print(f"Error saving [[{page_title}]]: {response['error']}")
+    else:
+        print(f"Saved [[{page_title}]], changed letters: {', '.join(changed)}")
 
 # Main script execution
 if __name__ == "__main__":
     endpoint = 'https://bahai.works/api.php'
     output_file = 'pages-from-cat-output.txt'
 
-    if len(sys.argv) >= 2 and sys.argv[-1].startswith('-type:'):
-        output_type = sys.argv[-1].split(':', 1)[1]
-    else:
-        output_type = 'formatted'
+    output_type = 'formatted'
+    workers = 6
+    letter = None
+    refresh = False
+    publish_page = False
+    for arg in sys.argv[1:]:
+        if arg.startswith('-type:'):
+            output_type = arg.split(':', 1)[1]
+        elif arg.startswith('-workers:'):
+            workers = max(1, int(arg.split(':', 1)[1]))
+        elif arg == '-refresh':
+            refresh = True
+        elif arg == '-publish':
+            publish_page = True
+        elif len(arg) == 1 and arg.isalpha():
+            letter = arg.upper()
+
+    if publish_page and output_type == 'plain':
+        print("Error: -publish only works with the formatted output.")
+        sys.exit(1)
 
-    if len(sys.argv) >= 2 and len(sys.argv[1]) == 1 and sys.argv[1].isalpha():
-        letter = sys.argv[1].upper()
-        collect_authors_category(letter, endpoint, output_file, output_type)
+    if letter:
+        generated = collect_authors_category(letter, endpoint, output_type, make_session(1), refresh)
     else:
-        collect_all_authors_categories(endpoint, output_file, output_type)
+        generated = collect_all_authors_categories(endpoint, output_type, workers, refresh)
+
+    # Start a fresh file each run so output from earlier runs doesn't pile up
+    with open(output_file, 'w', encoding='utf-8') as file:
+        file.write(''.join(generated.values()))
+    print(f"Saved {output_file}")
+
+    if publish_page:
+        publish(WikiSession(endpoint, username, password), 'Authors', generated)
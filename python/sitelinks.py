@@ -0,0 +1,86 @@
+r"""
+Helpers shared by api_addsitelinks_data.py and api_addsitelinks_data-bookformat.py to find 
+out which items already have a sitelink before any writes are sent.
+
+Items whose sitelinks could not be read, even after retrying, are reported and left out 
+of all three lists, so nothing is written for them until a later run can check them.
+"""
+
+import time
+import requests
+
+ENTITY_BATCH_SIZE = 50  # Most ids wbgetentities accepts in one request
+FETCH_RETRIES = 3
+RETRY_DELAY = 5  # Seconds, multiplied by the attempt number
+
+def fetch_entities(wiki, batch, site_id):
+    """Return the wbgetentities entities for one batch of ids, or None if every attempt failed."""
+    for attempt in range(1, FETCH_RETRIES + 1):
+        try:
+            data = wiki.get({
+                'action': 'wbgetentities',
+                'ids': '|'.join(batch),
+                'props': 'sitelinks',
+                'sitefilter': site_id,
+                'format': 'json'
+            }).json()
+            if 'error' not in data:
+                return data.get('entities', {})
+            error = data['error']
+        except (requests.RequestException, ValueError) as e:
+            error = e
+        print(f"Error fetching sitelinks for {batch[0]}..{batch[-1]} (attempt {attempt}/{FETCH_RETRIES}):", error)
+        if attempt < FETCH_RETRIES:
+            time.sleep(RETRY_DELAY * attempt)
+    return None
+
+def get_sitelinks(wiki, item_ids, site_id):
+    """
+    Return ({item id: linked page title or None} for the items that exist, [ids that could 
+    not be read], number of batches read), 50 ids per request.
+    """
+    sitelinks, unchecked, reads = {}, [], 0
+    for start in range(0, len(item_ids), ENTITY_BATCH_SIZE):
+        batch = item_ids[start:start + ENTITY_BATCH_SIZE]
+        entities = fetch_entities(wiki, batch, site_id)
+        if entities is None:
+            unchecked.extend(batch)
+            continue
+        reads += 1
+        for item_id, entity in entities.items():
+            if 'missing' in entity:
+                continue
+            link = entity.get('sitelinks', {}).get(site_id)
+            sitelinks[item_id] = link['title'] if link else None
+    return sitelinks, unchecked, reads
+
+def sort_by_sitelink(wiki, entries, site_id):
+    """
+    Split (item id, page title, ...) tuples into three lists: already linked to that page, 
+    linked to a different page, and not linked yet. Items that don't exist, or couldn't be 
+    read, are reported and dropped.
+    """
+    item_ids = list(dict.fromkeys(entry[0] for entry in entries))
+    sitelinks, unchecked, reads = get_sitelinks(wiki, item_ids, site_id)
+    unchecked = set(unchecked)
+
+    correct, conflicting, missing, skipped = [], [], [], 0
+    for entry in entries:
+        item_id, page_title = entry[0], entry[1]
+        if item_id in unchecked:
+            skipped += 1
+        elif item_id not in sitelinks:
+            print(f"Item {item_id} not found, skipping {page_title}")
+        elif sitelinks[item_id] is None:
+            missing.append(entry)
+        elif sitelinks[item_id] == page_title.replace('_', ' '):
+            correct.append(entry)
+        else:
+            print(f"Conflict: {item_id} already links to '{sitelinks[item_id]}', not '{page_title}'")
+            conflicting.append(entry)
+
+    if skipped:
+        print(f"Could not read the sitelinks of {len(unchecked)} item(s), skipping {skipped} entries until the next run")
+    print(f"Sitelinks: {len(correct)} already correct, {len(conflicting)} conflicting, {len(missing)} to set. "
+          f"Avoided {len(correct) + len(conflicting)} write(s) with {reads} read(s).")
+    return correct, conflicting, missing
@@ -0,0 +1,169 @@
+r"""
+Shared login handling for the api scripts in this folder.
+
+WikiSession logs in once and saves the cookies and CSRF token to wiki-session-cache.json, 
+so the next run starts without any login requests at all. If the saved login has expired 
+the wiki answers with badtoken or assertuserfailed, in which case the session logs in 
+again and repeats the request on its own.
+
+Usage from a script:
+
+	from wiki_session import WikiSession
+	wiki = WikiSession('https://bahai.works/api.php', username, password)
+	response = wiki.post({'action': 'edit', 'title': title, 'text': text, 'format': 'json'})
+
+Throttle and retry_after let several workers sharing a session back off together when 
+the wiki reports maxlag or sends a Retry-After header. retry_after is also used by 
+bahaiquest/search_api.py.
+"""
+
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+
+CACHE_FILE = 'wiki-session-cache.json'
+RELOGIN_ERRORS = {'badtoken', 'assertuserfailed', 'assertnameduserfailed', 'notloggedin'}
+
+class WikiSession:
+    """A requests session that remembers its login between runs and renews it when needed."""
+    def __init__(self, api_url, username, password, cache_file=CACHE_FILE):
+        self.api_url = api_url
+        self.username = username
+        self.password = password
+        self.cache_file = cache_file
+        self.session = requests.Session()
+        self.csrf_token = None
+        self.lock = threading.Lock()
+        self.load()
+
+    @property
+    def cache_key(self):
+        return f"{self.username}@{self.api_url}"
+
+    def load(self):
+        """Restore cookies and token saved by an earlier run, if any."""
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as file:
+                entry = json.load(file).get(self.cache_key)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if entry:
+            self.session.cookies = requests.utils.cookiejar_from_dict(entry['cookies'])
+            self.csrf_token = entry['csrf_token']
+
+    def save(self):
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as file:
+                cache = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            cache = {}
+        cache[self.cache_key] = {
+            'cookies': requests.utils.dict_from_cookiejar(self.session.cookies),
+            'csrf_token': self.csrf_token
+        }
+        # The file holds a live login, keep it readable only by us
+        fd = os.open(self.cache_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(cache, file, indent=2)
+
+    def login(self, stale_token=None):
+        """
+        Log in and fetch a new CSRF token. Skipped if another thread already renewed stale_token, 
+        or, without a stale_token, if another thread has logged in since the caller looked.
+        """
+        with self.lock:
+            if stale_token is not None and self.csrf_token != stale_token:
+                return
+            if stale_token is None and self.csrf_token is not None:
+                return
+
+            self.session.cookies.clear()
+
+            # Step 1: Get login token
+            login_token_response = self.session.get(self.api_url, params={
+                'action': 'query',
+                'meta': 'tokens',
+                'type': 'login',
+                'format': 'json'
+            })
+            login_token = login_token_response.json()['query']['tokens']['logintoken']
+
+            # Step 2: Perform login
+            login_response = self.session.post(self.api_url, data={
+                'action': 'login',
+                'lgname': self.username,
+                'lgpassword': self.password,
+                'lgtoken': login_token,
+                'format': 'json'
+            }).json()
+            if login_response.get('login', {}).get('result') != 'Success':
+                raise RuntimeError(f"Login as {self.username} failed: {login_response}")
+
+            # Step 3: Get CSRF token
+            csrf_token_response = self.session.get(self.api_url, params={
+                'action': 'query',
+                'meta': 'tokens',
+                'format': 'json'
+            })
+            self.csrf_token = csrf_token_response.json()['query']['tokens']['csrftoken']
+            self.save()
+
+    def get(self, params):
+        return self.session.get(self.api_url, params=params)
+
+    def post(self, data, max_logins=1, files=None):
+        """POST with the CSRF token and assert=user added, logging in again if the wiki rejects them.
+
+        files, as in requests, turns the request into a multipart upload."""
+        if self.csrf_token is None:
+            self.login()
+
+        for attempt in range(max_logins + 1):
+            token = self.csrf_token
+            response = self.session.post(self.api_url, data={**data, 'token': token, 'assert': 'user'}, files=files)
+            try:
+                code = response.json().get('error', {}).get('code')
+            except ValueError:
+                return response
+            if code not in RELOGIN_ERRORS or attempt == max_logins:
+                return response
+            print(f"Login expired ({code}), logging in again as {self.username}...")
+            self.login(stale_token=token)
+        return response
+
+    def mount(self, adapter):
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+class Throttle:
+    """Shared pause used by all workers to respect maxlag and Retry-After."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.resume_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            delay = self.resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+def retry_after(response, default=5):
+    """Seconds to wait from a Retry-After header, which is either a number or an HTTP date."""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
@@ -3,10 +3,21 @@ r"""
 This script is adapted from replace.py, however text and a prompt are 
 sent to ChatGPT who will make corrections and write them to the wiki.
 
-The section below after " {"role": "system", "content":..." is where you define
-the prompt that you want ChatGPT to follow while making corrections.
+SYSTEM_PROMPT below is where you define the prompt that you want ChatGPT to 
+follow while making corrections.
 
 run with: pwb bahainews_gpt.py -cat:"Baha'i News No 331"
+or: pwb bahainews_gpt.py -cat:"Baha'i News No 331" -workers:8 -rpm:500 -tpm:30000
+or: pwb bahainews_gpt.py -cat:"Baha'i News No 331" -refresh-cache (or -nocache)
+
+Responses are cached in llm-cache/ (see llm_cache.py), so a rerun only sends pages 
+whose text, or the prompt, changed since.
+
+Answering 'a' (automatic) at a page prompt switches to a pipeline for the rest of the 
+category: page texts are loaded 50 at a time, up to -workers ChatGPT requests run at 
+once within the -rpm (requests per minute) and -tpm (tokens per minute) budgets, and 
+the results are saved one at a time in category order, so pywikibot's edit throttle 
+still applies.
 
 Responsible for edits like this: https://bahai.media/index.php?title=File:Steel_shafts_for_concrete_pillars_of_Kampala_Temple,_1958.jpg&curid=15878&diff=135612&oldid=60149
 
@@ -17,25 +28,60 @@ This script was written by ChatGPT also.
 #
 # Distributed under the terms of the MIT license.
 #
+import itertools
+import threading
 import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import pywikibot
 from pywikibot import pagegenerators
 from requests.exceptions import RequestException
+from llm_cache import cache_from_args
 
 API_KEY = 'your-chat-gpt-api-key-here'
+MODEL = "gpt-4-turbo"
+
+# Budgets for automatic mode, see your OpenAI rate limits page
+WORKERS = 4  # Requests to ChatGPT in flight at once
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 30000
+
+SYSTEM_PROMPT = "The assistant is helping format image captions. First, the assistant places the following information at the top of the page: \"== File info ==\n{{cs\n| caption =\n| source =\n}}\n\n== File license ==\n{{Bn-excerpt}}\n\n\". Second, locate the caption and if it exists put it in the caption field. Third, locate the source and if it exists, place it in the source field. In the caption field, ensure correct transliterations for Bahá’í terms:  - Replace \"Baha'u'llah\" with \"Bahá’u’lláh.\"\n  - Replace \"Baha'is\" with \"Bahá’ís.\"\n  - Replace \"Bahá'í\" with \"Bahá’í.\"\n  - Replace \"Bahji\" with \"Bahjí.\"\n- If the caption is wrapped in quotation marks, remove them.\n\nFor the source field: If the source is in the format \"From BN [number] p [number],\" wrap it in the template {{bns|[number]|[number]}}.\n\nCategory Management:\n- Remove tags like [[Category:Baha'i News No xxx]] but preserve other category tags at the bottom of the page."
+
+def retry_after(response, default):
+    """Seconds to wait from a Retry-After header, which is either a number or an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30, cache=None):
+    """Interact with ChatGPT API to process text correction or modification.
+
+    With an LLMCache, an unchanged page and prompt are answered from disk."""
+    if cache is not None:
+        cached = cache.get(MODEL, SYSTEM_PROMPT, message)
+        if cached is not None:
+            return cached
 
-def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30):
-    """Interact with ChatGPT API to process text correction or modification."""
     url = "https://api.openai.com/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     data = {
-        "model": "gpt-4-turbo",
+        "model": MODEL,
         "messages": [
-            {"role": "system", "content": "The assistant is helping format image captions. First, the assistant places the following information at the top of the page: \"== File info ==\n{{cs\n| caption =\n| source =\n}}\n\n== File license ==\n{{Bn-excerpt}}\n\n\". Second, locate the caption and if it exists put it in the caption field. Third, locate the source and if it exists, place it in the source field. In the caption field, ensure correct transliterations for Bahá’í terms:  - Replace \"Baha'u'llah\" with \"Bahá’u’lláh.\"\n  - Replace \"Baha'is\" with \"Bahá’ís.\"\n  - Replace \"Bahá'í\" with \"Bahá’í.\"\n  - Replace \"Bahji\" with \"Bahjí.\"\n- If the caption is wrapped in quotation marks, remove them.\n\nFor the source field: If the source is in the format \"From BN [number] p [number],\" wrap it in the template {{bns|[number]|[number]}}.\n\nCategory Management:\n- Remove tags like [[Category:Baha'i News No xxx]] but preserve other category tags at the bottom of the page."},
+            {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": message}
         ]
     }
@@ -44,7 +90,15 @@ def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30):
         try:
             response = requests.post(url, headers=headers, json=data, timeout=30)
             if response.status_code == 200:
-                return response.json()['choices'][0]['message']['content']
+                content = response.json()['choices'][0]['message']['content']
+                if cache is not None:
+                    cache.put(MODEL, SYSTEM_PROMPT, message, content)
+                return content
+            elif response.status_code == 429 and attempt < max_retries:
+                # Over the rate limit, wait as long as the API asks
+                delay = retry_after(response, retry_delay)
+                print(f"Rate limited, retrying in {delay:.0f} seconds...")
+                time.sleep(delay)
             else:
                 print(f"API returned status code {response.status_code}: {response.text}")
                 break  # don't retry on bad request or unauthorized
@@ -58,13 +112,44 @@ def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30):
 
     return message  # fallback to original text
 
+def estimate_tokens(text):
+    """Rough token count, about 4 characters per token for English text."""
+    return len(text) // 4 + 1
+
+class RateBudget:
+    """Requests-per-minute and tokens-per-minute limits shared by the ChatGPT workers."""
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque()  # (time, tokens) of requests sent in the last minute
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """Wait until a request of this many tokens fits in both budgets, then count it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.window and now - self.window[0][0] >= 60:
+                    self.window.popleft()
+                used = sum(spent for _, spent in self.window)
+                # A request larger than the whole token budget is let through when the window is empty
+                if len(self.window) < self.requests_per_minute and (used + tokens <= self.tokens_per_minute or not self.window):
+                    self.window.append((now, tokens))
+                    return
+                delay = 60 - (now - self.window[0][0])
+            time.sleep(max(delay, 0.05))
+
 class ReplaceBot:
     """A bot that processes replacements using ChatGPT."""
-    def __init__(self, generator, summary: str = None):
+    def __init__(self, generator, summary: str = None, workers=WORKERS,
+                 requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, cache=None):
         self.generator = generator
         self.summary = summary
         self.site = pywikibot.Site()
         self.auto_confirm = False  # Set to True if user chooses 'a' (automatic)
+        self.workers = workers
+        self.budget = RateBudget(requests_per_minute, tokens_per_minute)
+        self.cache = cache
 
     def confirm_continue(self, message):
         """Prompt the user to confirm whether to continue, skip, or proceed automatically."""
@@ -86,12 +171,53 @@ class ReplaceBot:
     def apply_chatgpt_modification(self, text: str, page_title: str) -> str:
         """Apply modifications via ChatGPT API."""
         print(f"Requesting ChatGPT modification for page '{page_title}'")
-        return get_chatgpt_response(API_KEY, text)
+        return get_chatgpt_response(API_KEY, text, cache=self.cache)
+
+    def request_modification(self, text: str, page_title: str) -> str:
+        """Apply modifications via ChatGPT API once the rate budget allows it."""
+        # Input plus a reply about as long as the page; cached pages don't use the budget
+        if self.cache is None or not self.cache.has(MODEL, SYSTEM_PROMPT, text):
+            self.budget.acquire(estimate_tokens(SYSTEM_PROMPT + text) + estimate_tokens(text))
+        return self.apply_chatgpt_modification(text, page_title)
+
+    def run_automatic(self, pages):
+        """Process pages as a pipeline: preload texts in batches, keep up to self.workers 
+        ChatGPT requests running, and save the results one at a time in page order."""
+        pages_processed = 0
+        pending = deque()  # (page, original text, future) in page order
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for page in pagegenerators.PreloadingGenerator(pages):
+                try:
+                    original_text = page.text
+                except Exception as e:
+                    print(f"Error processing page {page.title()}: {e}")
+                    continue
+                print(f"Processing page: {page.title()}")
+                pending.append((page, original_text, executor.submit(self.request_modification, original_text, page.title())))
+                # Keep a few results ahead of the saves, without reading the whole category into memory
+                while len(pending) > self.workers * 2 or (pending and pending[0][2].done()):
+                    pages_processed += self.save_result(*pending.popleft())
+            while pending:
+                pages_processed += self.save_result(*pending.popleft())
+        return pages_processed
+
+    def save_result(self, page, original_text, future):
+        """Save one ChatGPT result, returns 1 if the page was changed."""
+        try:
+            new_text = future.result()
+        except Exception as e:
+            print(f"Error processing page {page.title()}: {e}")
+            return 0
+        if new_text == original_text:
+            return 0
+        self.save_page(page, new_text)
+        return 1
 
     def run(self):
         """Run the replacement bot."""
         pages_processed = 0
-        for page in self.generator:
+        pages = iter(self.generator)
+        for page in pages:
             decision = self.confirm_continue(f"Would you like to proceed with processing page '{page.title()}'?")
             if decision == "n":
                 print(f"Skipping page: {page.title()}")
@@ -100,6 +226,11 @@ class ReplaceBot:
                 print("Stopping the bot.")
                 break
 
+            if self.auto_confirm:
+                # No more questions, so the remaining pages no longer have to wait for each other
+                pages_processed += self.run_automatic(itertools.chain([page], pages))
+                break
+
             try:
                 print(f"Processing page: {page.title()}")
                 original_text = page.text
@@ -114,6 +245,8 @@ class ReplaceBot:
             print("No pages were modified.")
         else:
             print(f"Successfully processed {pages_processed} page(s).")
+        if self.cache is not None:
+            print(self.cache.summary())
 
     def save_page(self, page, new_text):
         """Save changes to the page."""
@@ -145,9 +278,16 @@ def main(*args: str) -> None:
     """Run the bot with category targeting and detailed debugging."""
     # Extract category from arguments if provided
     category_name = None
+    settings = {}
     for arg in args:
         if arg.startswith("-cat:"):
             category_name = arg[5:]
+        elif arg.startswith("-workers:"):
+            settings["workers"] = max(1, int(arg[9:]))
+        elif arg.startswith("-rpm:"):
+            settings["requests_per_minute"] = int(arg[5:])
+        elif arg.startswith("-tpm:"):
+            settings["tokens_per_minute"] = int(arg[5:])
 
     if not category_name:
         print("Error: Please specify a category with -cat:\"CategoryName\"")
@@ -174,7 +314,7 @@ def main(*args: str) -> None:
 
         print("Processing pages...")
 
-        bot = ReplaceBot(pages, summary="Applying ChatGPT-assisted modifications")
+        bot = ReplaceBot(pages, summary="Applying ChatGPT-assisted modifications", cache=cache_from_args(args), **settings)
         bot.run()
 
     except Exception as e:
@@ -3,11 +3,15 @@ r"""
 This script is adapted from replace.py, however text and a prompt are 
 sent to ChatGPT who will extract data and write the output to a json file.
 
-The section below after " {"role": "system", "content":..." is where you define
-the prompt that you want ChatGPT to follow while making corrections.
+SYSTEM_PROMPT below is where you define the prompt that you want ChatGPT to 
+follow while making corrections.
 
 run with: pwb bahaipediagpt -cat:Biographies
 or run: pwb bahaipediagpt -page:Peter_Khan
+add -refresh-cache to ask ChatGPT again for every page, or -nocache to skip the cache
+
+Responses are cached in llm-cache/ (see llm_cache.py), so a rerun only sends articles 
+whose text, or the prompt, changed since.
 
 This script was written by ChatGPT also. 
 """
@@ -24,56 +28,67 @@ import requests
 import pywikibot
 from pywikibot import pagegenerators
 from requests.exceptions import RequestException
+from llm_cache import cache_from_args
 import sys
 import re
 
 API_KEY = 'sk-xxxx'
+MODEL = "gpt-4-turbo"
+
+SYSTEM_PROMPT = (
+    "You are extracting structured Baha’i-related biographical data from Wikipedia-style articles. "
+    "Your goal is to return a JSON object with any of the following fields **if identifiable from the text**. "
+    "Even if the article doesn't have a template, you should analyze the full text carefully and infer data when appropriate. "
+    "Do not guess—only include fields that are clearly supported by the text, either explicitly or by strong implication.\n\n"
+    "Your output must be a single valid JSON object and contain only the following keys if relevant:\n"
+    "- image (first image file listed if multiple exist)\n"
+    "- birth_name (Source page specifcally mentions a different birth name)\n"
+    "- birth_date\n"
+    "- birth_place\n"
+    "- declaration_date (when the person became a Bahá’í, if known)\n"
+    "- declaration_place\n"
+    "- death_date\n"
+    "- death_place\n"
+    "- nationality\n"
+    "- lsa_member (list of places/years if known)\n"
+    "- abm (location and/or years if known)\n"
+    "- nsa_member (list of Assemblies/years if known)\n"
+    "- counsellor (region/years)\n"
+    "- itc_member (years of service)\n"
+    "- uhj_member (years of service)\n"
+    "- custodian (years years of service)\n"
+    "- appointedby (Only used in conjunction with the position Hand of the Cause of God)\n\n"
+    "Examples:\n"
+    "- If the article says someone 'was elected to the National Spiritual Assembly of Canada in 1953', return:\n"
+    "\"nsa_member\": [{\"assembly\": \"Canada\", \"start_date\": \"1953\"}] "
+    "- If the article says they were a 'counsellor for Africa from 1981 to 1986', return:\n"
+    "\"counsellor\": [{\"region\": \"Africa\", \"start_date\": \"1981\", \"end_date\": \"1986\"}] "
+    "- If it says they were a member of a Local Spiritual Assembly of Manchester, return:\n"
+    "\"lsa_member\": [{\"assembly\": \"Manchester\"}] "
+    "- If no info is available on a field, omit it.\n\n"
+    "Output only the JSON object and nothing else."
+)
+
+def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30, cache=None):
+    """Interact with ChatGPT API to extract structured JSON.
+
+    With an LLMCache, an unchanged article and prompt are answered from disk."""
+    if cache is not None:
+        cached = cache.get(MODEL, SYSTEM_PROMPT, message)
+        if cached is not None:
+            return cached
 
-def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30):
-    """Interact with ChatGPT API to extract structured JSON."""
     url = "https://api.openai.com/v1/chat/completions"
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
     data = {
-        "model": "gpt-4-turbo",
+        "model": MODEL,
         "messages": [
             {
                 "role": "system",
-                "content": (
-                    "You are extracting structured Baha’i-related biographical data from Wikipedia-style articles. "
-                    "Your goal is to return a JSON object with any of the following fields **if identifiable from the text**. "
-                    "Even if the article doesn't have a template, you should analyze the full text carefully and infer data when appropriate. "
-                    "Do not guess—only include fields that are clearly supported by the text, either explicitly or by strong implication.\n\n"
-                    "Your output must be a single valid JSON object and contain only the following keys if relevant:\n"
-                    "- image (first image file listed if multiple exist)\n"
-                    "- birth_name (Source page specifcally mentions a different birth name)\n"
-                    "- birth_date\n"
-                    "- birth_place\n"
-                    "- declaration_date (when the person became a Bahá’í, if known)\n"
-                    "- declaration_place\n"
-                    "- death_date\n"
-                    "- death_place\n"
-                    "- nationality\n"
-                    "- lsa_member (list of places/years if known)\n"
-                    "- abm (location and/or years if known)\n"
-                    "- nsa_member (list of Assemblies/years if known)\n"
-                    "- counsellor (region/years)\n"
-                    "- itc_member (years of service)\n"
-                    "- uhj_member (years of service)\n"
-                    "- custodian (years years of service)\n"
-                    "- appointedby (Only used in conjunction with the position Hand of the Cause of God)\n\n"
-                    "Examples:\n"
-                    "- If the article says someone 'was elected to the National Spiritual Assembly of Canada in 1953', return:\n"
-                    "\"nsa_member\": [{\"assembly\": \"Canada\", \"start_date\": \"1953\"}] "
-                    "- If the article says they were a 'counsellor for Africa from 1981 to 1986', return:\n"
-                    "\"counsellor\": [{\"region\": \"Africa\", \"start_date\": \"1981\", \"end_date\": \"1986\"}] "
-                    "- If it says they were a member of a Local Spiritual Assembly of Manchester, return:\n"
-                    "\"lsa_member\": [{\"assembly\": \"Manchester\"}] "
-                    "- If no info is available on a field, omit it.\n\n"
-                    "Output only the JSON object and nothing else."
-                )
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user",
@@ -86,7 +101,10 @@ def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30):
         try:
             response = requests.post(url, headers=headers, json=data, timeout=30)
             if response.status_code == 200:
-                return response.json()['choices'][0]['message']['content']
+                content = response.json()['choices'][0]['message']['content']
+                if cache is not None:
+                    cache.put(MODEL, SYSTEM_PROMPT, message, content)
+                return content
             else:
                 print(f"API error {response.status_code}: {response.text}")
                 break  # Avoid retrying on bad request
@@ -100,8 +118,9 @@ def get_chatgpt_response(api_key, message, max_retries=3, retry_delay=30):
     return "{}"  # Fallback to empty JSON
 
 class ExtractJSONBot:
-    def __init__(self, generator, output_dir="bios_output"):
+    def __init__(self, generator, output_dir="bios_output", cache=None):
         self.generator = generator
+        self.cache = cache
         self.site = pywikibot.Site()
         self.auto_confirm = False
         self.output_dir = output_dir
@@ -129,7 +148,7 @@ class ExtractJSONBot:
     def extract_json(self, text: str, title: str) -> dict:
         """Send full article to ChatGPT and return extracted JSON."""
         print(f"Sending article '{title}' to ChatGPT...")
-        gpt_output = get_chatgpt_response(API_KEY, text)
+        gpt_output = get_chatgpt_response(API_KEY, text, cache=self.cache)
         try:
             return json.loads(gpt_output)
         except json.JSONDecodeError:
@@ -171,12 +190,14 @@ class ExtractJSONBot:
                 print(f"Error on '{page.title()}': {e}")
 
         print(f"\nDone. Processed {pages_processed} page(s).")
+        if self.cache is not None:
+            print(self.cache.summary())
 
 if __name__ == "__main__":
     site = pywikibot.Site()
 
     if len(sys.argv) < 2:
-        print("Usage: pwb bahaipediagpt -cat:\"Biographies\" or -page:\"Page Title\"")
+        print("Usage: pwb bahaipediagpt -cat:\"Biographies\" or -page:\"Page Title\" [-nocache] [-refresh-cache]")
         sys.exit(1)
 
     arg = sys.argv[1]
@@ -193,5 +214,5 @@ if __name__ == "__main__":
         print("Invalid argument. Use -cat:\"CategoryName\" or -page:\"Page Title\"")
         sys.exit(1)
 
-    bot = ExtractJSONBot(gen)
+    bot = ExtractJSONBot(gen, cache=cache_from_args(sys.argv[2:]))
     bot.run()
@@ -0,0 +1,104 @@
+r"""
+On-disk cache of ChatGPT responses, shared by bahainews_gpt.py and bahaipedia_gpt.py.
+
+A response is stored under a hash of the model, the system prompt and the page text,
+so rerunning a category after a crash costs nothing for pages that were already done,
+while changing the prompt, the model or the page sends the page again. Only successful
+responses are stored.
+
+The cache lives in llm-cache/, one file per response. A file's modification time records
+when it was last used, and the least recently used files are removed once the folder
+grows past CACHE_MAX_BYTES.
+
+Both scripts take:
+	-nocache (Neither read nor write the cache)
+	-refresh-cache (Ask ChatGPT again for every page and replace the cached responses)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+CACHE_FOLDER = "llm-cache"
+CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class LLMCache:
+    """ChatGPT responses on disk, keyed on (model, system prompt hash, input hash)."""
+    def __init__(self, folder=CACHE_FOLDER, max_bytes=CACHE_MAX_BYTES, refresh=False):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.refresh = refresh  # Skip reading, so every response is fetched and stored again
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(folder) if entry.name.endswith(".json"))
+
+    def path(self, model, system_prompt, message):
+        key = "\0".join([model, sha256(system_prompt), sha256(message)])
+        return os.path.join(self.folder, f"{sha256(key)}.json")
+
+    def has(self, model, system_prompt, message):
+        """Whether get() would return a response, without counting a hit or miss."""
+        return not self.refresh and os.path.exists(self.path(model, system_prompt, message))
+
+    def get(self, model, system_prompt, message):
+        path = self.path(model, system_prompt, message)
+        entry = None
+        if not self.refresh:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                os.utime(path)  # Mark as recently used
+            except (FileNotFoundError, json.JSONDecodeError):
+                pass
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry["response"]
+
+    def put(self, model, system_prompt, message, response):
+        path = self.path(model, system_prompt, message)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": time.time(),
+                "model": model,
+                "system_prompt_sha256": sha256(system_prompt),
+                "input_sha256": sha256(message),
+                "response": response
+            }, f, ensure_ascii=False)
+        with self.lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+            self.size += os.path.getsize(path) - old_size
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used files until the folder is back under 90% of max_bytes."""
+        entries = sorted(
+            (entry for entry in os.scandir(self.folder) if entry.name.endswith(".json")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in entries:
+            if self.size <= self.max_bytes * 0.9:
+                break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def summary(self):
+        return f"ChatGPT cache: {self.hits} hit(s), {self.misses} miss(es)"
+
+def cache_from_args(args):
+    """Return the LLMCache the command line asks for, or None for -nocache."""
+    if "-nocache" in args:
+        return None
+    return LLMCache(refresh="-refresh-cache" in args)